@@ -1,4 +1,14 @@
+import holdem_argparser
 import holdem_calculator
+import holdem_engine
+
+import csv
+import json
+import sys
+
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from itertools import islice
 from time import time
 from pprint import pprint
 
@@ -19,6 +29,23 @@ s: Spades
 c: Clovers
 h: Hearts
 d: Diamonds
+
+Batch runs
+----------
+Spots are read from a file (or stdin with -), one per line, and their odds
+are written to stdout in the same order, as they are computed:
+
+    python calculator.py --input spots.jsonl --workers 4 > odds.jsonl
+    cat spots.csv | python calculator.py --input - --input-format csv --output-format csv
+
+- JSONL: {"pocket_cards": ["As", "Ts", "?", "?"], "board": ["Js", "3c", "Qs"]}
+- CSV: a header row with pocket_cards and board columns, cards separated by
+  spaces (e.g. As Ts ? ?,Js 3c Qs)
+
+Spots are evaluated in blocks of --block-size (see
+holdem_calculator.calculate_batch), so memory stays bounded whatever the
+input size. Invalid spots, and lines that are not spots at all, are reported
+on their own output line (with an error) and skipped.
 """
 
 pocket_cards = ['As', 'Ts']
@@ -27,13 +54,174 @@ board = list()
 
 pocket_cards.extend(['?', '?'])
 
+# Number of spots read and evaluated at once by batch runs
+BLOCK_SIZE = 10000
+INPUT_FORMATS = ('jsonl', 'csv')
+CSV_COLUMNS = ('pocket_cards', 'board', 'win', 'lose', 'tie', 'error')
+
 
 def main():
     hand_odds = holdem_calculator.calculate_odds(pocket_cards, board)
     pprint(hand_odds)
 
 
+def parse_command_line(argv=None):
+    """
+        Parse the command line of batch runs
+    :param argv: The arguments (defaults to sys.argv)
+    :return: The parsed arguments
+    """
+    parser = ArgumentParser(description="Calculate Texas Hold'em odds for the spots of a file.")
+    parser.add_argument('--input', help='File of spots to evaluate (- for stdin). Without it, '
+                                        'the odds of the example spot are printed.')
+    parser.add_argument('--input-format', choices=INPUT_FORMATS,
+                        help='Format of the spots (defaults to the file extension, else jsonl)')
+    parser.add_argument('--output-format', choices=INPUT_FORMATS, default='jsonl',
+                        help='Format of the results written to stdout')
+    parser.add_argument('--evaluator', choices=sorted(holdem_calculator.EVALUATORS),
+                        default=holdem_calculator.DEFAULT_EVALUATOR, help='Hand evaluator')
+    parser.add_argument('--exact', action='store_true',
+                        help='Enumerate every runout of the spots without a board instead of sampling')
+    parser.add_argument('--num-sims', type=int, default=holdem_calculator.NUM_SIMULATIONS,
+                        help='Number of Monte Carlo simulations (per possible unknown hand)')
+    parser.add_argument('--no-tables', action='store_true', help='Simulate the spots covered by the tables')
+    parser.add_argument('--workers', type=int, help='Number of worker processes (defaults to the cpu count)')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE,
+                        help='Number of spots evaluated at once')
+    return parser.parse_args(argv)
+
+
+def read_spots(lines, input_format: str):
+    """
+        Read spots, one per line
+    :param lines: The input lines
+    :param input_format: jsonl or csv
+    :return: Generator of (pocket cards, board, error) (board and pocket cards as card
+        lists, empty with what is wrong with the line as error for lines that are
+        not spots, error None otherwise)
+    """
+    if input_format == 'csv':
+        for row in csv.DictReader(lines):
+            yield (row.get('pocket_cards') or '').split(), (row.get('board') or '').split(), None
+        return
+    for line_number, line in enumerate(lines, 1):
+        if line.strip():
+            try:
+                spot = json.loads(line)
+                if not isinstance(spot, dict):
+                    raise TypeError('a spot must be a JSON object')
+                yield card_list(spot, 'pocket_cards'), card_list(spot, 'board'), None
+            except (json.JSONDecodeError, TypeError, KeyError) as error:
+                yield [], [], 'Invalid spot on line {}: {}'.format(line_number, error)
+
+
+def card_list(spot: dict, field: str) -> list:
+    """
+        Get the cards of a JSON spot field
+    :param spot: The spot
+    :param field: pocket_cards or board
+    :return: The cards (empty if the field is missing)
+    """
+    cards = spot.get(field) or []
+    if not isinstance(cards, list) or not all(isinstance(card, str) for card in cards):
+        raise TypeError('{} must be a list of cards'.format(field))
+    return list(cards)
+
+
+def validate_spot(spot: tuple, num_sims: int, exact: bool = False) -> tuple:
+    """
+        Parse and check a spot the way holdem_calculator does
+    :param spot: The (pocket cards, board)
+    :param num_sims: The number of Monte Carlo simulations
+    :param exact: Whether the spot is to be enumerated (at most one unknown hand)
+    :return: The parsed (pocket cards, board) and None, or None and what is wrong
+        with the spot
+    """
+    try:
+        pocket_cards, board, _ = holdem_argparser.parse_args(holdem_argparser.Args(list(spot[1]), list(spot[0]),
+                                                                                   num_sims))
+        holdem_calculator.sampled_spot(pocket_cards, board, exact)
+    except holdem_argparser.InvalidArguments as error:
+        return None, error.message
+    except ValueError as error:
+        return None, str(error)
+    return (pocket_cards, board), None
+
+
+def evaluate_spots(spots, args, engine: holdem_engine.HoldemEngine):
+    """
+        Evaluate spots block by block
+    :param spots: Iterable of (pocket cards, board, error) (see read_spots)
+    :param args: The parsed command line
+    :param engine: The engine running the simulations
+    :return: Generator of (pocket cards, board, results or None, error or None), in input order
+    """
+    spots = iter(spots)
+    while True:
+        block = list(islice(spots, args.block_size))
+        if not block:
+            break
+        checked_spots = [(None, error) if error else validate_spot(spot, args.num_sims, args.exact)
+                         for *spot, error in block]
+        results = holdem_calculator.calculate_batch([parsed_spot for parsed_spot, error in checked_spots
+                                                     if error is None],
+                                                    args.evaluator, engine, use_tables=not args.no_tables,
+                                                    num_sims=args.num_sims, exact=args.exact, parsed=True)
+        for (spot_pocket_cards, spot_board, _), (_, error) in zip(block, checked_spots):
+            if error is None:
+                _, odds = next(results)
+                yield spot_pocket_cards, spot_board, odds, None
+            else:
+                yield spot_pocket_cards, spot_board, None, error
+
+
+def write_results(results, output, output_format: str):
+    """
+        Write results as they come
+    :param results: Iterable of (pocket cards, board, results or None, error or None)
+    :param output: The output stream
+    :param output_format: jsonl or csv
+    """
+    writer = csv.writer(output) if output_format == 'csv' else None
+    if writer:
+        writer.writerow(CSV_COLUMNS)
+    for spot_pocket_cards, spot_board, odds, error in results:
+        if writer:
+            game_odds = odds['game_odds'] if odds else dict()
+            writer.writerow((' '.join(spot_pocket_cards), ' '.join(spot_board), game_odds.get('win', ''),
+                             game_odds.get('lose', ''), game_odds.get('tie', ''), error or ''))
+        else:
+            record = {'pocket_cards': spot_pocket_cards, 'board': spot_board}
+            record.update(odds or {'error': error})
+            output.write(json.dumps(record) + '\n')
+        output.flush()
+
+
+def run_batch(args):
+    """
+        Evaluate the spots of the input and write their results to stdout
+    :param args: The parsed command line
+    """
+    input_format = args.input_format
+    if input_format is None:
+        input_format = 'csv' if args.input.lower().endswith('.csv') else 'jsonl'
+    lines = sys.stdin if args.input == '-' else open(args.input, newline='')
+    output = sys.stdout
+    try:
+        # Messages printed along the way go to stderr, stdout only gets results
+        with redirect_stdout(sys.stderr), holdem_engine.HoldemEngine(processes=args.workers) as engine:
+            write_results(evaluate_spots(read_spots(lines, input_format), args, engine), output,
+                          args.output_format)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+
 if __name__ == '__main__':
-    start = time()
-    main()
-    print('Time elapsed: {} seconds'.format(round(time() - start, 3)))
+    command_line = parse_command_line()
+    if command_line.input is None:
+        start = time()
+        main()
+        print('Time elapsed: {} seconds'.format(round(time() - start, 3)))
+    else:
+        run_batch(command_line)
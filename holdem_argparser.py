@@ -3,6 +3,26 @@ import holdem_utils
 from re import compile
 
 
+class InvalidArguments(SystemExit):
+    """
+        Raised on invalid arguments. As a SystemExit, it ends scripts like
+        exit() does, while callers going through many requests can catch it
+        and skip the invalid ones.
+    """
+    def __init__(self, message: str):
+        super().__init__()
+        self.message = message
+
+
+def invalid_arguments(message: str):
+    """
+        Report invalid arguments
+    :param message: What is wrong with them
+    """
+    print(message)
+    raise InvalidArguments(message)
+
+
 class Args:
     """
         Wrapper class that holds the arguments for library calls
@@ -43,8 +63,7 @@ def validate_arguments(args: Args):
     :param args: The arguments
     """
     if args.num_sims <= 0:
-        print('Number of Monte Carlo simulations must be positive.')
-        exit()
+        invalid_arguments('Number of Monte Carlo simulations must be positive.')
     all_cards = list(args.cards)
     if args.board:
         all_cards.extend(args.board)
@@ -59,12 +78,10 @@ def validate_cards(all_cards: list):
     card_re = compile('[AKQJT98765432][scdh]')
     for card in all_cards:
         if card != '?' and not card_re.match(card):
-            print('Invalid card given.')
-            exit()
+            invalid_arguments('Invalid card given.')
         else:
             if all_cards.count(card) != 1 and card != '?':
-                print('The cards given must be unique.')
-                exit()
+                invalid_arguments('The cards given must be unique.')
 
 
 def create_hand_cards(raw_hand_cards: list) -> tuple:
@@ -74,8 +91,7 @@ def create_hand_cards(raw_hand_cards: list) -> tuple:
     :return: The processed player's hand cards
     """
     if not raw_hand_cards or len(raw_hand_cards) < 2 or len(raw_hand_cards) % 2:
-        print('You must provide a non-zero even number of hand cards')
-        exit()
+        invalid_arguments('You must provide a non-zero even number of hand cards')
 
     hand_cards, current_hand_cards = list(), list()
     for hand_card in raw_hand_cards:
@@ -87,12 +103,9 @@ def create_hand_cards(raw_hand_cards: list) -> tuple:
         if len(current_hand_cards) == 2:
             if None in current_hand_cards:
                 if current_hand_cards[0] or current_hand_cards[1]:
-                    print('Unknown hand cards must come in pairs')
-                    exit()
+                    invalid_arguments('Unknown hand cards must come in pairs')
             hand_cards.append((current_hand_cards[0], current_hand_cards[1]))
             current_hand_cards = list()
-    if hand_cards.count((None, None)) > 1:
-        print('Can only have one set of unknown hand cards')
     return tuple(hand_cards)
 
 
@@ -103,11 +116,9 @@ def parse_board(board: list):
     :return: The parsed and validated board cards
     """
     if len(board) > 5 or len(board) < 3:
-        print('Board must have a length of 3, 4, or 5.')
-        exit()
+        invalid_arguments('Board must have a length of 3, 4, or 5.')
     if '?' in board:
-        print('Board cannot have unknown cards')
-        exit()
+        invalid_arguments('Board cannot have unknown cards')
     return create_cards(board)
 
 
@@ -0,0 +1,303 @@
+import holdem_canonical
+import holdem_evaluator
+import holdem_utils
+
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from itertools import combinations
+
+"""
+Board strength index
+--------------------
+The strength of every two-card holding on a complete board only depends on
+the board. A RiverStrengths keeps them, along with their sorted strengths and
+the number of holdings of each hand category, so that the results of known
+hands against every holding of an unknown hand on that river are two binary
+searches, corrected for the few holdings that share a card with the known
+hands.
+
+River boards keep their RiverStrengths and turn boards the RiverStrengths of
+each of their river cards, in LRU caches keyed by the sorted board, so that
+every request on the same board (whatever the known hands) is answered
+without ranking a single hand.
+
+A HoldingResults counts the results of a known hand against each holding of
+the unknown hand over many boards, for the equity against each hand.
+"""
+
+# Number of river boards whose strengths are kept (about 20 kB each)
+RIVER_CACHE_SIZE = 1024
+# Number of turn boards whose river strengths are kept (about 1 MB each)
+TURN_CACHE_SIZE = 32
+NUM_POKER_HANDS = len(holdem_utils.HAND_RANKINGS)
+# Pairs of ranks, indexed by lower rank * NUM_RANKS + higher rank
+NUM_RANK_PAIRS = holdem_evaluator.NUM_RANKS * holdem_evaluator.NUM_RANKS
+
+
+class RiverStrengths:
+    """
+        The strength of every holding on a complete board
+    """
+    def __init__(self, board):
+        """
+        :param board: The five integer board cards
+        """
+        self.board = tuple(board)
+        self.strengths = holdem_evaluator.holding_strengths(board)
+        self.sorted_strengths = array('l', sorted(strength for strength in self.strengths if strength))
+        category_starts = [bisect_left(self.sorted_strengths, category << holdem_evaluator.CATEGORY_SHIFT)
+                           for category in range(NUM_POKER_HANDS + 1)]
+        self.category_counts = [stop - start for start, stop in zip(category_starts, category_starts[1:])]
+
+    def count(self, known_hands: list, dead_holdings, unknown_index: int, winner_list: list,
+              result_histograms: list, hand_range: list = None):
+        """
+            Add the results of the known hands against every holding of the
+            unknown hand on this board
+        :param known_hands: The (seat, integer cards) of each known hand
+        :param dead_holdings: The holdings (indices in holdem_evaluator.HOLDINGS) sharing
+            a card with the known hands
+        :param unknown_index: The seat of the unknown hand
+        :param winner_list: The number of times each player won (see holdem_utils.new_winner_list), updated
+        :param result_histograms: The hand histogram of each player, updated
+        :param hand_range: The (holding index, weight) of each hand of the unknown hand's
+            range (every holding left if None)
+        """
+        strengths = self.strengths
+        known_strengths = [strengths[holdem_evaluator.holding_index(*hand)] for _, hand in known_hands]
+        best_strength = max(known_strengths)
+        best_seats = [seat for (seat, _), strength in zip(known_hands, known_strengths) if strength == best_strength]
+        num_players = len(result_histograms)
+        unknown_histogram = result_histograms[unknown_index]
+
+        if hand_range is None:
+            lower = bisect_left(self.sorted_strengths, best_strength)
+            higher = len(self.sorted_strengths) - bisect_right(self.sorted_strengths, best_strength)
+            equal = len(self.sorted_strengths) - lower - higher
+            category_counts = list(self.category_counts)
+            for index in dead_holdings:
+                strength = strengths[index]
+                if not strength:
+                    continue
+                if strength < best_strength:
+                    lower -= 1
+                elif strength > best_strength:
+                    higher -= 1
+                else:
+                    equal -= 1
+                category_counts[strength >> holdem_evaluator.CATEGORY_SHIFT] -= 1
+        else:
+            lower, equal, higher = 0, 0, 0
+            category_counts = [0] * NUM_POKER_HANDS
+            for index, weight in hand_range:
+                strength = strengths[index]
+                if not strength:
+                    continue
+                if strength < best_strength:
+                    lower += weight
+                elif strength > best_strength:
+                    higher += weight
+                else:
+                    equal += weight
+                category_counts[strength >> holdem_evaluator.CATEGORY_SHIFT] += weight
+
+        num_holdings = lower + equal + higher
+        winner_list[unknown_index + 1] += higher
+        holdem_utils.count_pot(winner_list, best_seats + [unknown_index], num_players, equal)
+        holdem_utils.count_pot(winner_list, best_seats, num_players, lower)
+        for category, count in enumerate(category_counts):
+            unknown_histogram[category] += count
+        for (seat, _), strength in zip(known_hands, known_strengths):
+            result_histograms[seat][strength >> holdem_evaluator.CATEGORY_SHIFT] += num_holdings
+
+
+class HoldingResults:
+    """
+        The wins and split pots of a known hand against every holding of the
+        unknown hand, over many boards. As in holdem_evaluator.count_holdings,
+        the holdings without a flush only depend on their ranks: each board
+        counts once per pair of ranks, and only the holdings sharing a card
+        with the dealt board cards and the flushes are counted one by one
+    """
+    def __init__(self, deck):
+        """
+        :param deck: The integer cards the holdings and the board cards are dealt from
+        """
+        self.deck = tuple(deck)
+        self.wins = [0] * len(holdem_evaluator.HOLDINGS)
+        self.ties = [0] * len(holdem_evaluator.HOLDINGS)
+        self.pair_wins = [0] * NUM_RANK_PAIRS
+        self.pair_ties = [0] * NUM_RANK_PAIRS
+        # The strength of each pair of ranks (0 for impossible ones), keyed by the board ranks
+        self._pair_strengths = dict()
+
+    def _rank_pair_strengths(self, board_rank_key: int) -> list:
+        pair_strengths = self._pair_strengths.get(board_rank_key)
+        if pair_strengths is None:
+            pair_strengths = [0] * NUM_RANK_PAIRS
+            for first_rank in range(holdem_evaluator.NUM_RANKS):
+                first_key = board_rank_key + holdem_evaluator.RANK_KEYS[first_rank]
+                for second_rank in range(first_rank, holdem_evaluator.NUM_RANKS):
+                    pair_strengths[first_rank * holdem_evaluator.NUM_RANKS + second_rank] = \
+                        holdem_evaluator.RANK_TABLE.get(first_key + holdem_evaluator.RANK_KEYS[second_rank], 0)
+            self._pair_strengths[board_rank_key] = pair_strengths
+        return pair_strengths
+
+    def count(self, board, runout, strength: int, shared: bool, weight: int = 1):
+        """
+            Count a board on which the known hand has the best strength of the
+            known hands (it loses against every holding otherwise)
+        :param board: The five integer board cards
+        :param runout: The board cards dealt from the deck
+        :param strength: The known hand's strength
+        :param shared: Whether another known hand has the same strength, the
+            holdings below it then splitting the pot instead of losing it
+        :param weight: The number of times the board counts
+        """
+        board_key = 0
+        for card in board:
+            board_key += holdem_evaluator.CARD_KEYS[card]
+        pair_strengths = self._rank_pair_strengths(board_key >> holdem_evaluator.RANK_KEY_SHIFT)
+        lower_pairs, lower = (self.pair_ties, self.ties) if shared else (self.pair_wins, self.wins)
+        for pair, pair_strength in enumerate(pair_strengths):
+            if pair_strength < strength:
+                lower_pairs[pair] += weight
+            elif pair_strength == strength:
+                self.pair_ties[pair] += weight
+
+        def recount(first_card, second_card, holding_strength):
+            # Replace the count of a holding by its pair of ranks with its own
+            # (none if it shares a card with the board)
+            first_rank, second_rank = sorted((first_card >> 2, second_card >> 2))
+            holding = holdem_evaluator.holding_index(first_card, second_card)
+            pair_strength = pair_strengths[first_rank * holdem_evaluator.NUM_RANKS + second_rank]
+            if pair_strength < strength:
+                lower[holding] -= weight
+            elif pair_strength == strength:
+                self.ties[holding] -= weight
+            if holding_strength is None:
+                return
+            if holding_strength < strength:
+                lower[holding] += weight
+            elif holding_strength == strength:
+                self.ties[holding] += weight
+
+        for card in runout:
+            for other_card in self.deck:
+                if other_card != card and (other_card not in runout or other_card > card):
+                    recount(card, other_card, None)
+
+        # Only a suit with at least three board cards can make a flush, with
+        # (5 - its board cards) of the holding's cards
+        suit_counts = [board_key >> (suit << 2) & 0xF for suit in range(holdem_evaluator.NUM_SUITS)]
+        flush_suit = max(range(holdem_evaluator.NUM_SUITS), key=suit_counts.__getitem__)
+        flush_cards_needed = 5 - suit_counts[flush_suit]
+        if flush_cards_needed > 2:
+            return
+        flush_mask = 0
+        for card in board:
+            if card & 3 == flush_suit:
+                flush_mask |= holdem_evaluator.RANK_BITS[card]
+        cards = [card for card in self.deck if card not in runout]
+        flush_cards = [card for card in cards if card & 3 == flush_suit]
+        if flush_cards_needed <= 0:
+            holdings = combinations(cards, 2)
+        elif flush_cards_needed == 1:
+            holdings = ((flush_card, card) for flush_card in flush_cards for card in cards
+                        if card & 3 != flush_suit or card > flush_card)
+        else:
+            holdings = combinations(flush_cards, 2)
+        for first_card, second_card in holdings:
+            rank_mask = flush_mask
+            if first_card & 3 == flush_suit:
+                rank_mask |= holdem_evaluator.RANK_BITS[first_card]
+            if second_card & 3 == flush_suit:
+                rank_mask |= holdem_evaluator.RANK_BITS[second_card]
+            recount(first_card, second_card, holdem_evaluator.FLUSH_TABLE[rank_mask])
+
+    def results(self, group) -> tuple:
+        """
+            Get the results against each holding, the boards having been
+            counted once per orbit of the symmetry group (as many times as its
+            size): summed over the group, every board of an orbit counts once
+            per permutation
+        :param group: The suit permutations of the boards counted
+        :return: The wins and the split pots against each holding (indexed as
+            holdem_evaluator.HOLDINGS)
+        """
+        wins, ties = list(self.wins), list(self.ties)
+        for first_card, second_card in combinations(self.deck, 2):
+            first_rank, second_rank = sorted((first_card >> 2, second_card >> 2))
+            pair = first_rank * holdem_evaluator.NUM_RANKS + second_rank
+            holding = holdem_evaluator.holding_index(first_card, second_card)
+            wins[holding] += self.pair_wins[pair]
+            ties[holding] += self.pair_ties[pair]
+        if len(group) == 1:
+            return wins, ties
+        spread_wins, spread_ties = [0] * len(wins), [0] * len(ties)
+        for permutation in group:
+            for (first_card, second_card), holding_wins, holding_ties in zip(holdem_evaluator.HOLDINGS, wins, ties):
+                if holding_wins or holding_ties:
+                    holding = holdem_evaluator.holding_index(
+                        *holdem_canonical.permute_cards((first_card, second_card), permutation))
+                    spread_wins[holding] += holding_wins
+                    spread_ties[holding] += holding_ties
+        return [count // len(group) for count in spread_wins], [count // len(group) for count in spread_ties]
+
+
+@lru_cache(maxsize=RIVER_CACHE_SIZE)
+def river_strengths(board: tuple) -> RiverStrengths:
+    """
+        Get the strengths of every holding on a river board
+    :param board: The five integer board cards, sorted
+    :return: The RiverStrengths of the board
+    """
+    return RiverStrengths(board)
+
+
+@lru_cache(maxsize=TURN_CACHE_SIZE)
+def turn_strengths(board: tuple) -> dict:
+    """
+        Get the strengths of every holding on every river of a turn board
+    :param board: The four integer board cards, sorted
+    :return: The RiverStrengths of each river, keyed by the river card
+    """
+    return dict((card, RiverStrengths(board + (card,)))
+                for card in range(holdem_evaluator.DECK_SIZE) if card not in board)
+
+
+def board_results(pocket_cards: tuple, board, deck, hand_range: list = None) -> tuple:
+    """
+        Get the exact results of a turn or river spot with a single unknown
+        hand from the board index
+    :param pocket_cards: The players' integer hands, the unknown one (None, None)
+    :param board: The four or five integer board cards
+    :param deck: The integer cards left in the deck
+    :param hand_range: The (hand, weight) of each hand of the unknown hand's range
+        (see holdem_ranges.range_combos), every hand if None
+    :return: The number of times each player won (see holdem_utils.new_winner_list) and the
+        hand histogram of each player
+    """
+    unknown_index = pocket_cards.index((None, None))
+    known_hands = [(seat, hand) for seat, hand in enumerate(pocket_cards) if seat != unknown_index]
+    board_cards = frozenset(board)
+    dead_holdings = set()
+    for _, hand in known_hands:
+        for dead_card in hand:
+            dead_holdings.update(holdem_evaluator.holding_index(dead_card, card)
+                                 for card in range(holdem_evaluator.DECK_SIZE)
+                                 if card != dead_card and card not in board_cards)
+    if hand_range is not None:
+        hand_range = [(holdem_evaluator.holding_index(*hand), weight) for hand, weight in hand_range]
+
+    winner_list = holdem_utils.new_winner_list(len(pocket_cards))
+    result_histograms = [[0] * NUM_POKER_HANDS for _ in pocket_cards]
+    if len(board) == 5:
+        river_strengths(tuple(sorted(board))).count(known_hands, dead_holdings, unknown_index, winner_list,
+                                                    result_histograms, hand_range)
+        return winner_list, result_histograms
+    rivers = turn_strengths(tuple(sorted(board)))
+    for card in deck:
+        rivers[card].count(known_hands, dead_holdings, unknown_index, winner_list, result_histograms, hand_range)
+    return winner_list, result_histograms
@@ -0,0 +1,389 @@
+import mmap
+import os
+import pickle
+import struct
+import sys
+import threading
+
+import holdem_canonical
+import holdem_evaluator
+import holdem_utils
+
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+"""
+Result cache
+------------
+calculate_odds results are cached as raw counts (the split pots and the
+number of times each player won, see holdem_utils.new_winner_list, and each
+player's hand histogram), keyed by the spot normalised to its canonical suits,
+with every hand and the board sorted, plus the simulation mode. A Monte Carlo entry also records how many
+simulations it holds and answers any request for at most as many.
+
+Exhaustive entries of ResultCache can also keep the results of each runout
+(see holdem_calculator.simulate), from which the spots of the later streets
+are summed up instead of simulated (see holdem_calculator.street_results).
+"""
+
+EXHAUSTIVE = 'exhaustive'
+MONTE_CARLO = 'monte_carlo'
+MODES = (EXHAUSTIVE, MONTE_CARLO)
+# Default bounds of a ResultCache. Exhaustive flop entries keeping their
+# runouts take about 200 kB each, so the bytes bound is usually the one reached
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_MAX_BYTES = 64 << 20
+# Estimated size of a runout on top of its counters (its key and the pickling)
+RUNOUT_OVERHEAD = 24
+
+
+def spot_key(pocket_cards, board, mode: str) -> tuple:
+    """
+        Build the cache key of a spot
+    :param pocket_cards: The players' hands (as parsed by holdem_argparser)
+    :param board: The game board (as parsed by holdem_argparser)
+    :param mode: The simulation mode (EXHAUSTIVE or MONTE_CARLO)
+    :return: The key
+    """
+    hands = tuple(tuple(holdem_evaluator.encode_cards(hand_card)) for hand_card in pocket_cards)
+    hands, canonical_board, _ = holdem_canonical.canonical_spot(hands, holdem_evaluator.encode_cards(board or ()))
+    return hands, tuple(canonical_board), mode
+
+
+class ResultCache:
+    """
+        In-process LRU cache of simulation results, bounded by a number of
+        entries and by an (estimated) number of bytes
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param max_entries: The maximum number of entries
+        :param max_bytes: The maximum estimated (pickled) size of all entries, per-runout
+            results included (unbounded if None)
+        """
+        if max_entries <= 0 or (max_bytes is not None and max_bytes <= 0):
+            raise ValueError('Cache bounds must be positive.')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: tuple, num_sims: int = None):
+        """
+            Look up a spot
+        :param key: The spot key (see spot_key)
+        :param num_sims: The number of simulations requested (Monte Carlo only)
+        :return: The number of times each player won and the hand histogram of
+            each player, or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (num_sims is not None and entry[1] < num_sims):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            winner_list, result_histograms = entry[0]
+            return list(winner_list), [list(histogram) for histogram in result_histograms]
+
+    def get_runouts(self, key: tuple) -> dict:
+        """
+            Look up the results of each runout of a spot (the hit and miss
+            counters are left unchanged)
+        :param key: The spot key (see spot_key)
+        :return: The packed results of each runout, keyed by its sorted integer
+            cards in the spot's canonical suits, or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[3] is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[3]
+
+    def put(self, key: tuple, winner_list: list, result_histograms: list, num_sims: int = None,
+            runouts: dict = None):
+        """
+            Store the results of a spot, unless a Monte Carlo entry with more
+            simulations is already stored
+        :param key: The spot key (see spot_key)
+        :param winner_list: The number of times each player won
+        :param result_histograms: The hand histogram of each player
+        :param num_sims: The number of simulations run (Monte Carlo only)
+        :param runouts: The packed results of each runout (see get_runouts)
+        """
+        value = (tuple(winner_list), tuple(tuple(histogram) for histogram in result_histograms))
+        entry_size = len(pickle.dumps((key, value, num_sims)))
+        if runouts:
+            # Every runout packs as many counters as the spot's results
+            num_counts = len(winner_list) + sum(len(histogram) for histogram in result_histograms)
+            entry_size += len(runouts) * (RUNOUT_OVERHEAD + 8 * num_counts)
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None:
+                if num_sims is not None and current[1] > num_sims:
+                    return
+                self._remove(key)
+            self._entries[key] = (value, num_sims, entry_size, runouts)
+            self.size += entry_size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and
+                                                            self.size > self.max_bytes and len(self._entries) > 1):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: tuple):
+        self.size -= self._entries.pop(key)[2]
+
+    def clear(self):
+        """
+            Remove every entry (the counters are kept)
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        """
+            Get the cache counters
+        :return: The hits, misses, evictions, entries and estimated bytes
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries),
+                    'bytes': self.size}
+
+
+class DiskResultCache:
+    """
+        Persistent cache of simulation results, shared by every process on the
+        host that opens the same file. The file holds a header followed by
+        fixed-size records, each one:
+
+            key: 2 bytes per seat (255 for an unknown card, 254 for no seat),
+                5 board bytes (255 for no card) and the mode, padded to 8 bytes
+            number of simulations (0 for exhaustive results)
+            number of split pots, of times each player won and of split pots
+                each player shared (see holdem_utils.new_winner_list)
+            hand histogram of each player
+
+        with every number an unsigned 64-bit little-endian integer. The file is
+        memory-mapped and indexed by key, so lookups read the counters in place.
+        Records are only ever appended (under an exclusive lock where fcntl is
+        available); the latest record of a key wins.
+    """
+    MAGIC = b'HOCACHE2'
+    HEADER = struct.Struct('<8sQ')
+
+    def __init__(self, path: str, max_players: int = 2):
+        """
+        :param path: The cache file (created if missing)
+        :param max_players: The number of seats per record (only used when
+            creating the file)
+        """
+        self.path = path
+        if not os.path.exists(path) or not os.path.getsize(path):
+            with open(path, 'ab') as cache_file:
+                self._lock_file(cache_file, exclusive=True)
+                if not os.path.getsize(path):
+                    cache_file.write(self.HEADER.pack(self.MAGIC, max_players))
+        self._file = open(path, 'rb')
+        magic, self.max_players = self.HEADER.unpack(self._file.read(self.HEADER.size))
+        if magic != self.MAGIC:
+            raise ValueError('{} is not a result cache.'.format(path))
+        self.key_size = -(-(2 * self.max_players + 6) // 8) * 8
+        self.num_counts = 2 * self.max_players + 1 + self.max_players * len(holdem_utils.HAND_RANKINGS)
+        self.record_size = self.key_size + 8 * (1 + self.num_counts)
+        self.hits = 0
+        self.misses = 0
+        self._map = None
+        self._view = None
+        self._index = dict()
+        self._indexed_size = self.HEADER.size
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._index)
+
+    @staticmethod
+    def _lock_file(cache_file, exclusive: bool):
+        if fcntl is not None:
+            fcntl.flock(cache_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    @staticmethod
+    def _unlock_file(cache_file):
+        if fcntl is not None:
+            fcntl.flock(cache_file.fileno(), fcntl.LOCK_UN)
+
+    def encode_key(self, key: tuple) -> bytes:
+        """
+            Encode a spot key (see spot_key) in its fixed-size form
+        :param key: The spot key
+        :return: The encoded key, or None if the spot has too many players
+        """
+        hands, board, mode = key
+        if len(hands) > self.max_players:
+            return None
+        key_bytes = bytearray([254] * (2 * self.max_players))
+        for index, hand_card in enumerate(hands):
+            key_bytes[2 * index:2 * index + 2] = bytes(255 if card is None else card for card in hand_card)
+        key_bytes.extend(bytes(board) + bytes([255] * (5 - len(board))))
+        key_bytes.append(MODES.index(mode))
+        return bytes(key_bytes.ljust(self.key_size, b'\0'))
+
+    def refresh(self):
+        """
+            Index the records appended (by any process) since the last refresh
+        """
+        size = os.fstat(self._file.fileno()).st_size
+        complete_size = size - (size - self.HEADER.size) % self.record_size
+        if complete_size <= self._indexed_size:
+            return
+        if self._view is not None:
+            self._view.release()
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), complete_size, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        for offset in range(self._indexed_size, complete_size, self.record_size):
+            key_bytes = bytes(self._view[offset:offset + self.key_size])
+            num_sims = self._record(offset)[0]
+            current = self._index.get(key_bytes)
+            if current is None or self._record(current)[0] <= num_sims:
+                self._index[key_bytes] = offset
+        self._indexed_size = complete_size
+
+    def _record(self, offset: int):
+        # The counters of a record, read in place (unpacked on big-endian hosts)
+        start = offset + self.key_size
+        if sys.byteorder != 'little':
+            return struct.unpack_from('<{}Q'.format(1 + self.num_counts), self._view, start)
+        return self._view[start:start + 8 * (1 + self.num_counts)].cast('Q')
+
+    def get(self, key: tuple, num_sims: int = None):
+        """
+            Look up a spot
+        :param key: The spot key (see spot_key)
+        :param num_sims: The number of simulations requested (Monte Carlo only)
+        :return: The number of times each player won and the hand histogram of
+            each player, or None
+        """
+        key_bytes = self.encode_key(key)
+        with self._lock:
+            if key_bytes is not None and key_bytes not in self._index:
+                self.refresh()
+            offset = self._index.get(key_bytes)
+            if offset is None or (num_sims is not None and self._record(offset)[0] < num_sims):
+                self.misses += 1
+                return None
+            self.hits += 1
+            num_players = len(key[0])
+            counts = self._record(offset)[1:]
+            num_poker_hands = len(holdem_utils.HAND_RANKINGS)
+            ties_start = self.max_players + 1
+            winner_list = list(counts[:num_players + 1]) + list(counts[ties_start:ties_start + num_players])
+            start = 2 * self.max_players + 1
+            return winner_list, [list(counts[start + index * num_poker_hands:
+                                             start + (index + 1) * num_poker_hands])
+                                 for index in range(num_players)]
+
+    def get_runouts(self, key: tuple) -> dict:
+        """
+            Per-runout results are not persisted
+        :return: None
+        """
+        return None
+
+    def put(self, key: tuple, winner_list: list, result_histograms: list, num_sims: int = None,
+            runouts: dict = None):
+        """
+            Append the results of a spot, unless a Monte Carlo entry with more
+            simulations is already stored
+        :param key: The spot key (see spot_key)
+        :param winner_list: The number of times each player won
+        :param result_histograms: The hand histogram of each player
+        :param num_sims: The number of simulations run (Monte Carlo only)
+        :param runouts: Ignored (per-runout results are not persisted)
+        """
+        key_bytes = self.encode_key(key)
+        if key_bytes is None:
+            return
+        counts = [0] * self.num_counts
+        num_players = len(result_histograms)
+        counts[:num_players + 1] = winner_list[:num_players + 1]
+        counts[self.max_players + 1:self.max_players + 1 + num_players] = winner_list[num_players + 1:]
+        for index, histogram in enumerate(result_histograms):
+            start = 2 * self.max_players + 1 + index * len(histogram)
+            counts[start:start + len(histogram)] = histogram
+        record = key_bytes + struct.pack('<{}Q'.format(1 + self.num_counts), num_sims or 0, *counts)
+        with self._lock:
+            self.refresh()
+            offset = self._index.get(key_bytes)
+            if offset is not None and num_sims is not None and self._record(offset)[0] > num_sims:
+                return
+            with open(self.path, 'ab') as cache_file:
+                self._lock_file(cache_file, exclusive=True)
+                try:
+                    # Drop a torn record left by a writer that died mid-append
+                    size = os.fstat(cache_file.fileno()).st_size
+                    torn_size = (size - self.HEADER.size) % self.record_size
+                    if torn_size:
+                        cache_file.truncate(size - torn_size)
+                    cache_file.write(record)
+                    cache_file.flush()
+                finally:
+                    self._unlock_file(cache_file)
+            self.refresh()
+
+    def stats(self) -> dict:
+        """
+            Get the cache counters
+        :return: The hits, misses, entries and file size
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': len(self._index),
+                    'bytes': self._indexed_size}
+
+    def close(self):
+        """
+            Unmap and close the cache file
+        """
+        if self._view is not None:
+            self._view.release()
+            self._map.close()
+            self._view = self._map = None
+        self._file.close()
+
+
+_default_cache = None
+
+
+def get_default_cache() -> ResultCache:
+    """
+        Get the cache shared by calls that do not provide their own
+    :return: The default cache
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
@@ -1,202 +1,1254 @@
-import multiprocessing
 import holdem_argparser
+import holdem_boards
+import holdem_cache
+import holdem_canonical
+import holdem_engine
+import holdem_evaluator
+import holdem_numpy
+import holdem_ranges
+import holdem_sampling
+import holdem_tables
 import holdem_utils
 
+import asyncio
+import queue
+import random
+import threading
+import time
+
+from array import array
+from functools import partial
+from itertools import combinations, islice
+from math import comb, nan, sqrt
+
 NUM_SIMULATIONS = 200
+# Adaptive sampling runs batches of simulations until the estimate converges,
+# at least MIN_ADAPTIVE_BATCHES of them (to estimate the error) and at most
+# MAX_ADAPTIVE_BATCHES
+MIN_ADAPTIVE_BATCHES = 4
+MAX_ADAPTIVE_BATCHES = 1000
+# Exhaustive spots missing at most this many board cards keep the results of
+# each runout in the result cache, to answer the later streets
+MAX_KEPT_RUNOUT_CARDS = 2
+# Batch requests run the spots costing at most a chunk's share of the work
+# whole, grouped in tasks of about BATCH_TASK_COST deals; the others are split
+# over the pool like single requests
+BATCH_TASK_COST = 1 << 20
+
+# Hand evaluators by name. Each one provides evaluate_hands and hand_category
+# and works on its own card representation:
+# - detect_hand: holdem_utils.Card instances, ranked by holdem_utils.detect_hand
+# - lookup: integer cards, ranked through the holdem_evaluator lookup tables
+# - numpy: integer cards, whole batches of deals ranked with NumPy (optional
+#   dependency, see holdem_numpy)
+EVALUATORS = {'detect_hand': holdem_utils,
+              'lookup': holdem_evaluator,
+              'numpy': holdem_numpy}
+DEFAULT_EVALUATOR = 'lookup'
 
 
-def calculate_odds(pocket_cards: list, board: list):
+def calculate_odds(pocket_cards: list, board: list, evaluator: str = DEFAULT_EVALUATOR,
+                   engine: holdem_engine.HoldemEngine = None, use_tables: bool = True,
+                   cache: holdem_cache.ResultCache = None, use_cache: bool = True,
+                   num_sims: int = NUM_SIMULATIONS, exact: bool = False,
+                   target_error: float = None, time_budget: float = None, sampling: str = 'random',
+                   progress=None, cancel_token: holdem_engine.CancellationToken = None, timeout: float = None,
+                   ranges: dict = None, combo_equity: bool = False):
     """
         Collect the arguments, create the deck and start the simulation
     :param pocket_cards: The players' hands (as list)
     :param board: The game board (as list)
+    :param evaluator: The name of the hand evaluator (see EVALUATORS)
+    :param engine: The engine running the simulation (defaults to the shared engine)
+    :param use_tables: Serve the spots covered by the precomputed tables (see
+        holdem_tables) from them instead of simulating
+    :param cache: The result cache (defaults to the shared cache)
+    :param use_cache: Look the spot up in the result cache and store new results in it
+    :param num_sims: The number of Monte Carlo simulations (per possible unknown hand),
+        used when there is no board or when several hands are unknown
+    :param exact: Enumerate every unknown hand and every runout even when there
+        is no board, instead of sampling (at most one unknown hand)
+    :param target_error: Sample in batches of num_sims simulations until the standard
+        error of every win and tie percentage is at most target_error (in
+        percentage points)
+    :param time_budget: Sample for at most time_budget seconds, in batches sized from
+        the measured throughput (with target_error, whichever comes first)
+    :param sampling: How the Monte Carlo boards are drawn (see holdem_sampling.SAMPLING_STRATEGIES).
+        Other strategies than random boards sample in MIN_ADAPTIVE_BATCHES batches (of
+        a share of num_sims each) without target_error or time_budget, to report their error
+    :param progress: Function called with the results so far after each chunk of work
+        (each batch of a simulation sampling in batches): as returned, with the number of deals
+        behind them ('num_samples'), the time spent so far ('elapsed', in seconds) and
+        whether they only cover part of an enumeration or of the strata ('partial':
+        such results are biased until complete, not estimates of the odds) (see
+        iterate_odds)
+    :param cancel_token: Stop the simulation (between two chunks of work) once the
+        token is cancelled
+    :param timeout: Stop the simulation (between two chunks of work) after timeout seconds
+    :param ranges: The range of the unknown hand (see holdem_ranges), as a range string
+        or a parsed range keyed by its seat index, e.g. {1: 'QQ+, AKs'}. Spots with a
+        range are neither served from the tables nor cached.
+    :param combo_equity: Also return the player's equity against each hand of the unknown
+        hand (see combo_equity_results), computed in the same pass. Such requests are
+        neither served from the tables nor cached. Enumerations with the lookup or
+        numpy evaluator count each holding on every runout (about 0.2 s instead of
+        0.1 s on a flop); the other requests deal the unknown hands one at a time.
+    :return: The results (see holdem_utils.parse_result). With target_error or
+        time_budget, or another sampling strategy than random boards for a Monte
+        Carlo simulation, they also hold the 'standard_error' achieved (0 for exact
+        results, None when fewer than MIN_ADAPTIVE_BATCHES batches ran), the number
+        of deals evaluated ('num_samples') and the number of independent random
+        deals as accurate as them ('effective_samples', None without an error).
+        An adaptive simulation stopped after some batches returns the results of
+        these batches, marked as 'cancelled'; any other stopped simulation raises
+        holdem_engine.SimulationCancelled
     """
-    args = holdem_argparser.Args(board, pocket_cards, NUM_SIMULATIONS)
+    if evaluator not in EVALUATORS:
+        raise ValueError('Unknown evaluator: {}'.format(evaluator))
+    if evaluator == 'numpy' and not holdem_numpy.available():
+        raise RuntimeError('The numpy evaluator requires NumPy.')
+    if sampling not in holdem_sampling.SAMPLING_STRATEGIES:
+        raise ValueError('Unknown sampling strategy: {}'.format(sampling))
+    if evaluator == 'numpy' and sampling != 'random':
+        raise ValueError('The numpy evaluator only draws random boards.')
+    args = holdem_argparser.Args(board, pocket_cards, num_sims)
     pocket_cards, board, num_sims = holdem_argparser.parse_args(args)
-    deck = holdem_utils.generate_deck(pocket_cards, board)
+    adaptive = target_error is not None or time_budget is not None
+    sampled = sampled_spot(pocket_cards, board, exact)
+    if sampled and sampling != 'random' and pocket_cards.count((None, None)) > 1:
+        raise ValueError('Several unknown hands are only dealt at random.')
+    # Monte Carlo simulations run in batches to estimate their error
+    batched = sampled and (adaptive or sampling != 'random')
+    hand_range = None
+    if ranges:
+        hand_range = parse_hand_range(pocket_cards, ranges)
+        use_tables = use_cache = False
+    hand_results = None
+    if combo_equity:
+        if pocket_cards.count((None, None)) != 1:
+            raise ValueError('Equity per hand needs a single unknown hand.')
+        hand_results = dict()
+        use_tables = use_cache = False
+    if timeout is not None:
+        cancel_token = holdem_engine.CancellationToken(timeout, cancel_token)
+    results, standard_error, num_effective, num_samples, cancelled = None, 0.0, None, None, False
+    if use_tables and not board:
+        results = holdem_tables.lookup_spot(pocket_cards)
+
+    # Exhaustive results are exact, Monte Carlo results answer any request for
+    # at most as many simulations (but carry no error for batched requests)
+    if results is None and use_cache:
+        if cache is None:
+            cache = holdem_cache.get_default_cache()
+        if sampled:
+            mode, cache_sims = holdem_cache.MONTE_CARLO, num_sims
+        else:
+            mode, cache_sims = holdem_cache.EXHAUSTIVE, None
+        key = holdem_cache.spot_key(pocket_cards, board, mode)
+        if not batched:
+            results = cache.get(key, cache_sims)
+        if results is None and board and len(board) > 3:
+            results = street_results(cache, pocket_cards, board)
+            if results is not None:
+                cache.put(key, *results)
+
+    if results is None:
+        deck = holdem_utils.generate_deck(pocket_cards, board)
+        print('Board: {}'.format(board))
+        runout_results = dict() if use_cache and not sampled else None
+        start_time = time.monotonic()
+        if batched:
+            batch_progress = None if progress is None else \
+                lambda *batch_results: progress(progress_odds(
+                    adaptive_odds(pocket_cards, *batch_results, verbose=False), start_time))
+            # Without a target, num_sims simulations are shared between the fewest batches
+            batch_sims, max_batches = (num_sims, MAX_ADAPTIVE_BATCHES) if adaptive else \
+                (-(-num_sims // MIN_ADAPTIVE_BATCHES), MIN_ADAPTIVE_BATCHES)
+            winner_list, result_histograms, standard_error, num_effective, num_samples, cache_sims, cancelled = \
+                adaptive_simulate(pocket_cards, board, deck, batch_sims, evaluator, engine, target_error,
+                                  time_budget, sampling, batch_progress, cancel_token, hand_range, hand_results,
+                                  max_batches)
+            if cancelled and not adaptive:
+                cancel_token.check()
+            results = (winner_list, result_histograms)
+        else:
+            chunk_progress = None if progress is None else \
+                lambda winner_list, result_histograms, partial: progress(progress_odds(
+                    holdem_utils.parse_result(pocket_cards, winner_list, result_histograms, verbose=False),
+                    start_time, winner_list, partial))
+            results = simulate(pocket_cards, board, deck, num_sims, evaluator, engine, exact, sampling,
+                               runout_results, cancel_token, chunk_progress, hand_range, hand_results)
+        if use_cache:
+            cache.put(key, *results, cache_sims, runouts=runout_results or None)
+
+    if adaptive or batched:
+        # Exact results cover every deal
+        if num_samples is None:
+            num_samples = holdem_utils.count_deals(results[0])
+        odds = adaptive_odds(pocket_cards, *results, standard_error, num_effective, num_samples)
+        if cancelled:
+            odds['cancelled'] = True
+    else:
+        odds = holdem_utils.parse_result(pocket_cards, *results)
+    if combo_equity:
+        odds['combo_hands'], odds['combo_equity'], odds['class_equity'] = combo_equity_results(hand_results)
+    return odds
+
+
+def combo_equity_results(hand_results: dict) -> tuple:
+    """
+        Get the player's equity (wins plus half of the split pots, in percent)
+        against each hand of the unknown hand, and against each starting hand class
+    :param hand_results: The player's wins, split pots and the number of deals against
+        each hand (see simulate)
+    :return: The hands (as card strings, e.g. "AsKd"), the equity against each of them
+        (array of doubles) and the equity against each class (array of
+        holdem_tables.NUM_CLASSES doubles indexed by holdem_tables.hand_class,
+        nan for the classes without any hand)
+    """
+    equities = array('d')
+    # The equity against a class is the mean over its hands (which need not be dealt as many boards)
+    class_equities, class_hands = [0.0] * holdem_tables.NUM_CLASSES, [0] * holdem_tables.NUM_CLASSES
+    for hand, (wins, ties, deals) in hand_results.items():
+        equity = 100 * (wins + ties / 2) / deals
+        equities.append(equity)
+        first_card, second_card = (holdem_evaluator.encode_card(holdem_utils.Card(card))
+                                   for card in (hand[:2], hand[2:]))
+        class_index = holdem_tables.hand_class(first_card, second_card)
+        class_equities[class_index] += equity
+        class_hands[class_index] += 1
+    class_equities = array('d', (equity / num_hands if num_hands else nan
+                                 for equity, num_hands in zip(class_equities, class_hands)))
+    return list(hand_results), equities, class_equities
+
+
+def parse_hand_range(pocket_cards: tuple, ranges: dict) -> dict:
+    """
+        Get the range of the unknown hand of a spot
+    :param pocket_cards: The players' hands (as parsed by holdem_argparser)
+    :param ranges: The range keyed by its seat index (see calculate_odds)
+    :return: The parsed range (see holdem_ranges.parse_range)
+    """
+    if len(ranges) != 1 or pocket_cards.count((None, None)) != 1:
+        raise ValueError('Ranges are only supported for a single unknown hand.')
+    (seat, hand_range), = ranges.items()
+    if not 0 <= seat < len(pocket_cards) or pocket_cards[seat] != (None, None):
+        raise ValueError('Seat {} does not hold an unknown hand.'.format(seat))
+    return holdem_ranges.parse_range(hand_range) if isinstance(hand_range, str) else hand_range
+
+
+def adaptive_odds(pocket_cards: tuple, winner_list: list, result_histograms: list, standard_error: float,
+                  num_effective: float, num_samples: int, verbose: bool = True) -> dict:
+    """
+        Build the results of an adaptive request (see calculate_odds)
+    :param pocket_cards: The players' hands
+    :param winner_list: The number of times each player won (see holdem_utils.new_winner_list)
+    :param result_histograms: The hand histogram of each player
+    :param standard_error: The standard error reached (None if too few batches ran to
+        estimate it)
+    :param num_effective: The number of independent random deals as accurate (None
+        if all of them)
+    :param num_samples: The number of deals evaluated
+    :param verbose: Print the odds
+    :return: The results
+    """
+    odds = holdem_utils.parse_result(pocket_cards, winner_list, result_histograms, verbose)
+    if standard_error is None:
+        odds['standard_error'] = odds['effective_samples'] = None
+    else:
+        odds['standard_error'] = round(standard_error, 2)
+        odds['effective_samples'] = num_samples if num_effective is None else round(num_effective)
+    odds['num_samples'] = num_samples
+    return odds
+
+
+def progress_odds(odds: dict, start_time: float, winner_list: list = None, partial: bool = False) -> dict:
+    """
+        Add the progress of a simulation to its results so far
+    :param odds: The results so far
+    :param start_time: When the simulation started (time.monotonic)
+    :param winner_list: The number of times each player won so far (to count the
+        deals, if the results do not)
+    :param partial: Whether the results only cover part of an enumeration (see simulate)
+    :return: The results
+    """
+    if winner_list is not None:
+        odds['num_samples'] = holdem_utils.count_deals(winner_list)
+    odds['elapsed'] = round(time.monotonic() - start_time, 3)
+    odds['partial'] = partial
+    return odds
+
+
+def iterate_odds(pocket_cards: list, board: list, **kwargs):
+    """
+        Calculate odds like calculate_odds, yielding the results so far after
+        each chunk of work (see the calculate_odds progress argument) and then
+        the final results (with 'complete' set). The calculation runs on a
+        background thread and is cancelled if the generator is closed early.
+        Exhaustive chunks come in enumeration order, so their results so far
+        only cover some runouts (or unknown hands) and are marked 'partial':
+        they are not estimates of the odds until complete.
+    :param pocket_cards: The players' hands (as list)
+    :param board: The game board (as list)
+    :param kwargs: The other calculate_odds arguments
+    :return: Generator of the results
+    """
+    updates = queue.Queue()
+    cancel_token = holdem_engine.CancellationToken(parent=kwargs.pop('cancel_token', None))
+    thread = threading.Thread(target=_queue_odds, args=(updates.put, pocket_cards, board, cancel_token, kwargs),
+                              daemon=True)
+    thread.start()
+    try:
+        while True:
+            odds, error = updates.get()
+            if error is not None:
+                raise error
+            yield odds
+            if odds['complete']:
+                break
+    finally:
+        cancel_token.cancel()
+
+
+async def aiterate_odds(pocket_cards: list, board: list, **kwargs):
+    """
+        Asynchronous version of iterate_odds: the calculation runs on a
+        background thread and the results are yielded to the event loop
+    :param pocket_cards: The players' hands (as list)
+    :param board: The game board (as list)
+    :param kwargs: The other calculate_odds arguments
+    :return: Asynchronous generator of the results
+    """
+    loop = asyncio.get_running_loop()
+    updates = asyncio.Queue()
+    cancel_token = holdem_engine.CancellationToken(parent=kwargs.pop('cancel_token', None))
+    thread = threading.Thread(target=_queue_odds, daemon=True,
+                              args=(partial(loop.call_soon_threadsafe, updates.put_nowait),
+                                    pocket_cards, board, cancel_token, kwargs))
+    thread.start()
+    try:
+        while True:
+            odds, error = await updates.get()
+            if error is not None:
+                raise error
+            yield odds
+            if odds['complete']:
+                break
+    finally:
+        cancel_token.cancel()
+
+
+def _queue_odds(put, pocket_cards, board, cancel_token, kwargs):
+    # Run calculate_odds, putting each (results, error) update. The final
+    # results count as many deals as the last update (none if served from the
+    # tables or the cache)
+    start_time = time.monotonic()
+    updates = list()
 
-    return run_simulation(pocket_cards, board, deck, num_sims)
+    def put_update(odds):
+        updates.append(odds)
+        put((dict(odds, complete=False), None))
+    try:
+        odds = calculate_odds(pocket_cards, board, cancel_token=cancel_token, progress=put_update, **kwargs)
+    except BaseException as error:
+        # Including the SystemExit of invalid arguments (see holdem_argparser)
+        put((None, error))
+        return
+    odds = progress_odds(odds, start_time)
+    odds.setdefault('num_samples', updates[-1]['num_samples'] if updates else None)
+    odds['complete'] = True
+    put((odds, None))
 
 
-def run_simulation(pocket_cards: tuple, given_board: tuple, deck: tuple, num_sims: int):
+def street_results(cache, pocket_cards: tuple, board: list) -> tuple:
+    """
+        Sum up the results of a turn or river spot from the per-runout results
+        of an earlier street of the same hands (see simulate), if cached
+    :param cache: The result cache
+    :param pocket_cards: The players' hands (as parsed by holdem_argparser)
+    :param board: The game board (as parsed by holdem_argparser)
+    :return: The number of times each player won (see holdem_utils.new_winner_list) and the
+        hand histogram of each player, or None
+    """
+    hands = tuple(tuple(holdem_evaluator.encode_cards(hand_card)) for hand_card in pocket_cards)
+    board_cards = holdem_evaluator.encode_cards(board)
+    for num_later_cards in range(1, min(len(board) - 3, MAX_KEPT_RUNOUT_CARDS) + 1):
+        for later_cards in combinations(board_cards, num_later_cards):
+            earlier_board = [card for card in board_cards if card not in later_cards]
+            earlier_hands, earlier_board, permutation = holdem_canonical.canonical_spot(hands, earlier_board)
+            runouts = cache.get_runouts((earlier_hands, tuple(earlier_board), holdem_cache.EXHAUSTIVE))
+            if runouts is None:
+                continue
+            # The runouts of the earlier street that deal the later cards
+            later_cards = set(holdem_canonical.permute_cards(later_cards, permutation))
+            task_results = [counts for runout, counts in runouts.items() if later_cards.issubset(runout)]
+            return unpack_results(reduce_results(task_results, len(hands)), len(hands))
+    return None
+
+
+def adaptive_simulate(pocket_cards: tuple, given_board: tuple, deck: tuple, num_sims: int,
+                      evaluator: str = DEFAULT_EVALUATOR, engine: holdem_engine.HoldemEngine = None,
+                      target_error: float = None, time_budget: float = None, sampling: str = 'random',
+                      progress=None, cancel_token: holdem_engine.CancellationToken = None,
+                      hand_range: dict = None, hand_results: dict = None,
+                      max_batches: int = MAX_ADAPTIVE_BATCHES) -> tuple:
+    """
+        Run batches of num_sims simulations until the results converge or the
+        time runs out. The error is estimated from the spread of the batch
+        results (batch means), so it holds whatever the simulation weights.
+        Other strategies than random boards share the boards of each batch
+        between the hands of a single unknown hand from the results against
+        each hand class in the batches before it (see
+        holdem_sampling.neyman_allocation).
+        With a time budget, a first batch of a single simulation measures the
+        throughput, and the batches are then sized so that MIN_ADAPTIVE_BATCHES
+        of them fit in the budget (that first batch only counts in the results:
+        batch means need batches of one size).
+    :param pocket_cards: The players' hands (as tuple)
+    :param given_board: The game board (as tuple)
+    :param deck: The game deck (as tuple)
+    :param num_sims: The number of simulations per batch
+    :param evaluator: The name of the hand evaluator (see EVALUATORS)
+    :param engine: The engine running the simulation (defaults to the shared engine)
+    :param target_error: The standard error (in percentage points) every win and tie
+        percentage should reach
+    :param time_budget: The time (in seconds) no batch should be expected to overrun
+    :param sampling: How the boards are drawn (see holdem_sampling.SAMPLING_STRATEGIES)
+    :param progress: Function called after each batch with the results so far (as
+        returned, without the number of batches)
+    :param cancel_token: Stop once the token is cancelled, keeping the batches done
+        (raises holdem_engine.SimulationCancelled if there is none)
+    :param hand_range: The range of the unknown hand (see holdem_ranges.parse_range)
+    :param hand_results: Filled with the results against each hand of the unknown hand (see simulate)
+    :param max_batches: The number of batches after which to stop anyway
+    :return: The number of times each player won (see holdem_utils.new_winner_list), the hand
+        histogram of each player, the standard error reached (None below
+        MIN_ADAPTIVE_BATCHES batches), the number of independent random deals as
+        accurate (see holdem_sampling.effective_samples), the number of deals
+        evaluated, the number of simulations run and whether the token stopped
+        the simulation
+    """
+    start_time = time.monotonic()
+    winner_list, result_histograms = new_results(len(pocket_cards))
+    batch_odds, num_deals, num_simulations, cancelled = list(), 0, 0, False
+    standard_error = num_effective = None
+    measuring = time_budget is not None
+    batch_sims = 1 if measuring else num_sims
+    class_results = None
+    if sampling != 'random' and pocket_cards.count((None, None)) == 1:
+        class_results = [[0, 0, 0] for _ in range(holdem_tables.NUM_CLASSES)]
+    while True:
+        batch_start, deal_counts = time.monotonic(), list()
+        try:
+            batch_winner_list, batch_histograms = simulate(pocket_cards, given_board, deck, batch_sims, evaluator,
+                                                           engine, sampling=sampling, cancel_token=cancel_token,
+                                                           hand_range=hand_range, hand_results=hand_results,
+                                                           deal_counts=deal_counts, class_results=class_results)
+        except holdem_engine.SimulationCancelled:
+            # A batch stopped halfway is dropped: its chunks are not a uniform sample
+            if not num_simulations:
+                raise
+            cancelled = True
+            break
+        batch_time = time.monotonic() - batch_start
+        add_results(winner_list, result_histograms, batch_winner_list, batch_histograms)
+        num_deals += deal_counts[0]
+        num_simulations += batch_sims
+        if measuring:
+            measuring = False
+            remaining_time = time_budget - (time.monotonic() - start_time)
+            batch_sims = max(1, min(num_sims, int(remaining_time / MIN_ADAPTIVE_BATCHES / max(batch_time, 1e-6))))
+            batch_time *= batch_sims
+        else:
+            batch_total = float(holdem_utils.count_deals(batch_winner_list))
+            batch_odds.append([100 * count / batch_total for count in batch_winner_list])
+            if len(batch_odds) >= MIN_ADAPTIVE_BATCHES:
+                standard_errors = batch_standard_errors(batch_odds)
+                standard_error = max(standard_errors)
+                num_effective = holdem_sampling.effective_samples(batch_odds, standard_errors)
+        if progress is not None:
+            progress(winner_list, result_histograms, standard_error, num_effective, num_deals)
+
+        # Stop when converged, or when the next batch would not fit in the time budget
+        if len(batch_odds) >= max_batches:
+            break
+        if target_error is not None and standard_error is not None and standard_error <= target_error:
+            break
+        if time_budget is not None and time.monotonic() - start_time + batch_time > time_budget:
+            break
+    return winner_list, result_histograms, standard_error, num_effective, num_deals, num_simulations, cancelled
+
+
+def batch_standard_errors(batch_odds: list) -> list:
+    """
+        Estimate the standard error of percentages averaged over batches
+    :param batch_odds: The percentages of each batch (e.g. ties and each player's wins)
+    :return: The standard error of the mean of each percentage (inf with a single batch)
+    """
+    num_batches = len(batch_odds)
+    if num_batches < 2:
+        return [float('inf')] * len(batch_odds[0])
+    standard_errors = list()
+    for values in zip(*batch_odds):
+        mean = sum(values) / num_batches
+        variance = sum((value - mean) ** 2 for value in values) / (num_batches - 1)
+        standard_errors.append(sqrt(variance / num_batches))
+    return standard_errors
+
+
+def warm_up(spots, cache, evaluator: str = DEFAULT_EVALUATOR, engine: holdem_engine.HoldemEngine = None) -> int:
+    """
+        Fill a result cache (e.g. a holdem_cache.DiskResultCache) with the
+        results of some spots
+    :param spots: Iterable of (pocket cards, board), as given to calculate_odds
+    :param cache: The result cache
+    :param evaluator: The name of the hand evaluator (see EVALUATORS)
+    :param engine: The engine running the simulations (defaults to the shared engine)
+    :return: The number of spots that had to be computed
+    """
+    misses = cache.misses
+    for pocket_cards, board in spots:
+        calculate_odds(list(pocket_cards), list(board), evaluator, engine, use_tables=False, cache=cache)
+    return cache.misses - misses
+
+
+def calculate_batch(spots, evaluator: str = DEFAULT_EVALUATOR, engine: holdem_engine.HoldemEngine = None,
+                    use_tables: bool = True, cache: holdem_cache.ResultCache = None, use_cache: bool = True,
+                    num_sims: int = NUM_SIMULATIONS, exact: bool = False, ordered: bool = True,
+                    parsed: bool = False):
+    """
+        Calculate the odds of many spots at once. Each spot is parsed once and
+        served from the tables or the cache if possible; the spots left are
+        deduplicated (up to suit symmetry) and scheduled over the engine by
+        estimated cost: the cheap ones whole, grouped in tasks (most
+        expensive first), then the expensive ones split over the pool.
+    :param spots: Iterable of (pocket cards, board), as given to calculate_odds
+    :param evaluator: The name of the hand evaluator (see EVALUATORS)
+    :param engine: The engine running the simulations (defaults to the shared engine)
+    :param use_tables: Serve the spots covered by the precomputed tables from them
+    :param cache: The result cache (defaults to the shared cache)
+    :param use_cache: Look the spots up in the result cache and store new results in it
+    :param num_sims: The number of Monte Carlo simulations (per possible unknown hand)
+    :param exact: Enumerate every unknown hand and every runout even when there is no board
+    :param ordered: Yield the results in input order (otherwise as soon as they are known)
+    :param parsed: The spots are already parsed (by holdem_argparser.parse_args), as
+        (pocket cards, board)
+    :return: Generator of (spot index, results) (see holdem_utils.parse_result)
+    """
+    if evaluator not in EVALUATORS:
+        raise ValueError('Unknown evaluator: {}'.format(evaluator))
+    if evaluator == 'numpy' and not holdem_numpy.available():
+        raise RuntimeError('The numpy evaluator requires NumPy.')
+    if engine is None:
+        engine = holdem_engine.get_default_engine()
+    if use_cache and cache is None:
+        cache = holdem_cache.get_default_cache()
+
+    # Parse the spots and find the distinct ones left to simulate
+    parsed_spots, known, pending = list(), dict(), dict()
+    for index, (pocket_cards, board) in enumerate(spots):
+        if not parsed:
+            args = holdem_argparser.Args(list(board), list(pocket_cards), num_sims)
+            pocket_cards, board, _ = holdem_argparser.parse_args(args)
+        parsed_spots.append(pocket_cards)
+        sampled = sampled_spot(pocket_cards, board, exact)
+        mode, cache_sims = (holdem_cache.MONTE_CARLO, num_sims) if sampled else (holdem_cache.EXHAUSTIVE, None)
+        key = holdem_cache.spot_key(pocket_cards, board, mode)
+        if key in pending:
+            pending[key][3].append(index)
+            continue
+        results = holdem_tables.lookup_spot(pocket_cards) if use_tables and not board else None
+        if results is None and use_cache:
+            results = cache.get(key, cache_sims)
+        if results is not None:
+            known[index] = results
+        else:
+            pending[key] = (pocket_cards, board, cache_sims, [index])
+
+    # Cheap spots first (most expensive first, so that the small tasks fill
+    # the pool at the end), then the expensive ones
+    costs = {key: spot_cost(pocket_cards, board, num_sims, exact)
+             for key, (pocket_cards, board, _, _) in pending.items()}
+    max_task_cost = min(BATCH_TASK_COST, max(1, sum(costs.values()) // engine.num_chunks))
+    keys = sorted(pending, key=costs.get, reverse=True)
+    expensive_keys = [key for key in keys if costs[key] > max_task_cost]
+    cheap_tasks, task_keys, task_cost = list(), list(), 0
+    for key in keys[len(expensive_keys):]:
+        if task_keys and task_cost + costs[key] > max_task_cost:
+            cheap_tasks.append(task_keys)
+            task_keys, task_cost = list(), 0
+        task_keys.append(key)
+        task_cost += costs[key]
+    if task_keys:
+        cheap_tasks.append(task_keys)
+
+    def computed_results():
+        # Yield the (key, results) of every pending spot as they are computed
+        task = partial(spot_batch_simulation, (evaluator, num_sims, exact))
+        task_spots = [[pending[key][:2] for key in task_keys] for task_keys in cheap_tasks]
+        for task_index, task_results in engine.imap_unordered(partial(_indexed, task), enumerate(task_spots)):
+            for key, counts in zip(cheap_tasks[task_index], task_results):
+                yield key, unpack_results(counts, len(pending[key][0]))
+        for key in expensive_keys:
+            pocket_cards, board, _, _ = pending[key]
+            deck = holdem_utils.generate_deck(pocket_cards, board)
+            yield key, simulate(pocket_cards, board, deck, num_sims, evaluator, engine, exact)
+
+    # Yield the results known, in input order as far as known if ordered
+    next_index = 0
+    for key, results in computed_results():
+        pocket_cards, board, cache_sims, indices = pending[key]
+        if use_cache:
+            cache.put(key, *results, cache_sims)
+        for index in indices:
+            known[index] = results
+        for index in ([] if ordered else list(known)):
+            yield index, holdem_utils.parse_result(parsed_spots[index], *known.pop(index), verbose=False)
+        while next_index in known:
+            yield next_index, holdem_utils.parse_result(parsed_spots[next_index], *known.pop(next_index),
+                                                        verbose=False)
+            next_index += 1
+    for index in sorted(known):
+        yield index, holdem_utils.parse_result(parsed_spots[index], *known[index], verbose=False)
+
+
+def sampled_spot(pocket_cards: tuple, board: list, exact: bool = False) -> bool:
+    """
+        Check whether a spot is simulated by Monte Carlo: when there is no
+        board (unless exact), and always when several hands are unknown, as
+        enumerating every joint deal of them would not end
+    :param pocket_cards: The players' hands (as parsed by holdem_argparser)
+    :param board: The game board (as parsed by holdem_argparser)
+    :param exact: Enumerate every unknown hand and every runout even when there is no board
+    :return: Whether the spot is sampled
+    """
+    if pocket_cards.count((None, None)) > 1:
+        if exact:
+            raise ValueError('Exact enumeration supports at most one unknown hand.')
+        return True
+    return not (board or exact)
+
+
+def spot_cost(pocket_cards: tuple, board: list, num_sims: int, exact: bool = False) -> int:
+    """
+        Estimate the cost of simulating a spot
+    :param pocket_cards: The players' hands (as parsed by holdem_argparser)
+    :param board: The game board (as parsed by holdem_argparser)
+    :param num_sims: The number of Monte Carlo simulations (per possible unknown hand)
+    :param exact: Enumerate every unknown hand and every runout even when there is no board
+    :return: The number of deals evaluated
+    """
+    board_length = len(board or ())
+    num_unknown = pocket_cards.count((None, None))
+    num_cards = 52 - board_length - 2 * (len(pocket_cards) - num_unknown)
+    num_hands = comb(num_cards, 2) if num_unknown else 1
+    if not sampled_spot(pocket_cards, board, exact):
+        return comb(num_cards, 5 - board_length) * num_hands
+    return num_sims * num_hands
+
+
+def _indexed(func, indexed_item):
+    # Apply func to the item of an (index, item) pair, keeping the index
+    index, item = indexed_item
+    return index, func(item)
+
+
+def spot_batch_simulation(context, spots):
+    """
+        Simulate some whole spots, one after the other, in the calling process
+    :param context: The request shared by every task (evaluator, number of simulations, exact)
+    :param spots: The (pocket cards, board) of each spot, as parsed by holdem_argparser
+    :return: The packed results of each spot
+    """
+    evaluator, num_sims, exact = context
+    engine = holdem_engine.HoldemEngine(processes=0)
+    task_results = list()
+    for pocket_cards, board in spots:
+        deck = holdem_utils.generate_deck(pocket_cards, board)
+        task_results.append(pack_results(*simulate(pocket_cards, board, deck, num_sims, evaluator, engine,
+                                                   exact)))
+    return task_results
+
+
+def run_simulation(pocket_cards: tuple, given_board: tuple, deck: tuple, num_sims: int,
+                   evaluator: str = DEFAULT_EVALUATOR, engine: holdem_engine.HoldemEngine = None,
+                   cancel_token: holdem_engine.CancellationToken = None):
     """
 
     :param pocket_cards: The players' hands (as tuple)
     :param given_board: The game board (as tuple)
     :param deck: The game deck (as tuple
     :param num_sims: The number of simulation (for pocket hand strength)
+    :param evaluator: The name of the hand evaluator (see EVALUATORS)
+    :param engine: The engine running the simulation (defaults to the shared engine)
+    :param cancel_token: Stop the simulation once the token is cancelled (raises
+        holdem_engine.SimulationCancelled)
     :return:
     """
-    num_players = len(pocket_cards)
-    board_length = 0 if given_board is None else len(given_board)
     print('Board: {}'.format(given_board))
+    winner_list, result_histograms = simulate(pocket_cards, given_board, deck, num_sims, evaluator, engine,
+                                              cancel_token=cancel_token)
+    return holdem_utils.parse_result(pocket_cards, winner_list, result_histograms)
 
+
+def simulate(pocket_cards: tuple, given_board: tuple, deck: tuple, num_sims: int,
+             evaluator: str = DEFAULT_EVALUATOR, engine: holdem_engine.HoldemEngine = None,
+             exact: bool = False, sampling: str = 'random', runout_results: dict = None,
+             cancel_token: holdem_engine.CancellationToken = None, progress=None,
+             hand_range: dict = None, hand_results: dict = None, deal_counts: list = None,
+             class_results: list = None) -> tuple:
     """
-    Create data structures to manage multiple processes:
-    
-    1) winner_list: Number of times each player wins a hand
-    2) result_probabilities: A list for each player holding the number of
-        times each type of poker hand (e.g. flush, straight) occurred
+        Run the simulation and collect the raw results
+    :param pocket_cards: The players' hands (as tuple)
+    :param given_board: The game board (as tuple)
+    :param deck: The game deck (as tuple)
+    :param num_sims: The number of simulation (for pocket hand strength)
+    :param evaluator: The name of the hand evaluator (see EVALUATORS)
+    :param engine: The engine running the simulation (defaults to the shared engine)
+    :param exact: Enumerate every runout even when there is no board
+    :param sampling: How the Monte Carlo boards are drawn (see holdem_sampling.SAMPLING_STRATEGIES)
+    :param runout_results: Filled with the packed results of every runout, keyed by
+        its sorted integer cards in the spot's canonical suits, for exhaustive
+        simulations of the lookup evaluator missing at most MAX_KEPT_RUNOUT_CARDS
+        board cards (left empty otherwise)
+    :param cancel_token: Stop handing out chunks of work once the token is cancelled
+        (raises holdem_engine.SimulationCancelled)
+    :param progress: Function called after each completed chunk of work with the
+        number of times each player won and the hand histogram of each player so far,
+        and whether they are partial: the chunks of enumerations (of runouts or of
+        unknown hands) and of strata come in order, so only the chunks of random
+        boards add up to a uniform sample before the last one
+    :param hand_range: The range of the unknown hand (see holdem_ranges.parse_range),
+        every possible hand if None
+    :param hand_results: Filled with the first known hand's wins, split pots and the
+        number of deals against each hand of the (single) unknown hand, keyed by its
+        card string (e.g. "AsKd"), added to the counts already there
+    :param deal_counts: Appended with the number of deals evaluated, for Monte Carlo
+        simulations (the results count each deal as many times as the deals the
+        symmetries and range weights make it stand for)
+    :param class_results: The player's equity sums against each hand class of the
+        (single) unknown hand (see holdem_sampling.class_deviations), from which
+        Monte Carlo simulations share their boards between the hands by class and
+        weight (see holdem_sampling.neyman_allocation) instead of dealing num_sims
+        boards against each hand; added to with the results of the simulation
+    :return: The number of times each player won (see holdem_utils.new_winner_list) and the
+        hand histogram of each player
     """
-    num_processes = multiprocessing.cpu_count()
-    num_poker_hands = len(holdem_utils.HAND_RANKINGS)
-    num_histograms = num_processes * num_players * num_poker_hands
+    if engine is None:
+        engine = holdem_engine.get_default_engine()
+    num_players = len(pocket_cards)
+    num_unknown = pocket_cards.count((None, None))
+    board_length = 0 if given_board is None else len(given_board)
+
+    if evaluator == 'lookup' and board_length >= 4 and num_unknown == 1 and hand_results is None:
+        # Turn and river spots are summed up from the strengths of every
+        # holding on each river, kept across requests (see holdem_boards)
+        pocket_cards = tuple(tuple(holdem_evaluator.encode_cards(hand_card)) for hand_card in pocket_cards)
+        deck = holdem_evaluator.encode_cards(deck)
+        if hand_range is not None:
+            hand_range = holdem_ranges.range_combos(hand_range, deck)
+        results = holdem_boards.board_results(pocket_cards, holdem_evaluator.encode_cards(given_board), deck,
+                                              hand_range)
+        if progress is not None:
+            progress(*results, False)
+        return results
 
-    winner_list = multiprocessing.Array('i', num_processes * (num_players + 1))
-    result_probabilities = multiprocessing.Array('i', num_histograms)
+    # Hand the evaluator its own cards. Integer cards are relabelled to the spot's canonical suits and the
+    # enumerations only evaluate one of the holdings/runouts that the suit
+    # permutations leaving the spot unchanged map onto each other
+    group, permutation = (holdem_canonical.IDENTITY,), holdem_canonical.IDENTITY
+    if evaluator != 'detect_hand':
+        pocket_cards = tuple(tuple(holdem_evaluator.encode_cards(hand_card)) for hand_card in pocket_cards)
+        board_cards = holdem_evaluator.encode_cards(given_board) if given_board else []
+        pocket_cards, board_cards, permutation = holdem_canonical.canonical_spot(pocket_cards, board_cards)
+        given_board = board_cards if given_board else given_board
+        deck = holdem_canonical.permute_cards(holdem_evaluator.encode_cards(deck), permutation)
+        group = holdem_canonical.stabilizer(pocket_cards, given_board)
+        if hand_range is not None:
+            # The hands of the range left in the deck, and the symmetries that keep their weights
+            hand_range = holdem_ranges.range_combos(hand_range, deck, permutation)
+            group = holdem_ranges.range_stabilizer(hand_range, group)
+    elif hand_range is not None:
+        hand_range = [(tuple(holdem_utils.Card(holdem_evaluator.decode_card(card)) for card in hand), weight)
+                      for hand, weight in holdem_ranges.range_combos(hand_range, holdem_evaluator.encode_cards(deck))]
 
-    if given_board:
+    if (given_board or exact) and num_unknown <= 1:
         generate_all_boards = holdem_utils.generate_exhaustive_boards
     else:
-        generate_all_boards = holdem_utils.generate_random_boards
+        generate_all_boards = holdem_sampling.SAMPLING_STRATEGIES[sampling]
+    exhaustive = generate_all_boards is holdem_utils.generate_exhaustive_boards
+    if exhaustive:
+        class_results = None
+    # Ranges need the unknown hands one at a time, and so do results per hand
+    # unless each runout is dealt once against every unknown hand
+    deal_runouts = exhaustive and (None, None) in pocket_cards and evaluator != 'detect_hand'
+    per_hand = hand_range is not None or (hand_results is not None and not deal_runouts)
+    keep_runouts = (runout_results is not None and exhaustive and evaluator == 'lookup' and
+                    5 - board_length <= MAX_KEPT_RUNOUT_CARDS and not per_hand and hand_results is None)
 
-    if (None, None) in pocket_cards:
-        pocket_cards = list(pocket_cards)
+    # Every task only receives the range of the work it should do and
+    # generates its opponent hands and boards itself. It accumulates its own
+    # results over the whole range and returns them as one compact array,
+    # which is reduced once all tasks are done
+    seed = random.randrange(1 << 63)
+    if deal_runouts and not per_hand:
+        # Every runout is dealt once, against all the unknown hands at once
         unknown_index = pocket_cards.index((None, None))
-        deck_list = list(deck)
-        pool = multiprocessing.Pool(processes=num_processes,
-                                    initializer=unknown_simulation_init,
-                                    initargs=(pocket_cards, unknown_index,
-                                              deck_list, generate_all_boards,
-                                              board_length, given_board, num_sims,
-                                              winner_list, result_probabilities))
-        pool.map(unknown_simulation, holdem_utils.generate_pocket_cards(deck))
+        task = partial(runout_simulation, (pocket_cards, unknown_index, deck, board_length, given_board, group,
+                                           keep_runouts, hand_results is not None))
+        num_tasks = comb(len(deck), 5 - board_length)
+    elif evaluator == 'numpy' and not per_hand:
+        # Batches of deals are evaluated as arrays, without symmetry reduction
+        task = partial(batch_simulation, (pocket_cards, given_board, deck, exhaustive, seed))
+        num_tasks = holdem_numpy.count_deals(deck, num_unknown, 5 - board_length, num_sims, exhaustive)
+    elif num_unknown > 1:
+        # The unknown hands and the board are dealt together, as many deals as
+        # with one unknown hand
+        task = partial(multiway_simulation, (evaluator, pocket_cards, deck, board_length, given_board, seed))
+        num_tasks = num_sims * comb(len(deck), 2)
+    elif (None, None) in pocket_cards:
+        unknown_index = pocket_cards.index((None, None))
+        # With a range, only its hands are simulated
+        weighted_hands = hand_range if hand_range is not None else \
+            [(hand, 1) for hand in holdem_utils.generate_pocket_cards(deck)]
+        hand_boards = None
+        if class_results is not None:
+            # The hands simulated are grouped by class and weight
+            strata = dict()
+            for hand, range_weight in weighted_hands:
+                weight = orbit_size(hand, group) * range_weight
+                if weight:
+                    stratum = (unknown_hand_class(hand), weight)
+                    strata[stratum] = strata.get(stratum, 0) + 1
+            deviations = holdem_sampling.class_deviations(class_results)
+            hand_boards = dict(zip(strata, holdem_sampling.neyman_allocation(
+                [(num_hands, weight, deviations[class_index]) for (class_index, weight), num_hands in strata.items()],
+                num_sims)))
+        task = partial(unknown_simulation, (evaluator, pocket_cards, unknown_index, deck, generate_all_boards,
+                                            board_length, given_board, num_sims, seed, group, hand_range,
+                                            hand_results is not None or class_results is not None, hand_boards))
+        num_tasks = len(weighted_hands)
+    else:
+        task = partial(simulation, (evaluator, given_board, pocket_cards, deck,
+                                    generate_all_boards, board_length, num_sims, seed, group, keep_runouts))
+        num_tasks = holdem_utils.count_boards(generate_all_boards, deck, num_sims, board_length)
+    if deal_counts is not None and not exhaustive:
+        if task.func is unknown_simulation:
+            # num_sims boards (or the boards of their stratum) against each unknown hand simulated
+            if hand_boards is None:
+                hands = (hand for hand, _ in weighted_hands)
+                deal_counts.append(num_sims * sum(1 for _ in holdem_canonical.orbit_representatives(hands, group)))
+            else:
+                deal_counts.append(sum(num_hands * hand_boards[stratum][0] for stratum, num_hands in strata.items()))
+        else:
+            deal_counts.append(num_tasks)
+    num_chunks = engine.num_chunks if cancel_token is None and progress is None else engine.num_cancellable_chunks
+    chunks = holdem_engine.split_range(num_tasks, num_chunks)
+    if progress is None:
+        task_results = engine.map(task, chunks, cancel_token)
     else:
-        find_winner(generate_all_boards, deck, pocket_cards, board_length,
-                    given_board, num_sims, winner_list, result_probabilities)
+        # Running totals, updated as the chunks complete (in any order)
+        ordered_chunks = (exhaustive or task.func is unknown_simulation or
+                          generate_all_boards is holdem_sampling.generate_stratified_boards)
+        task_results, counts = list(), reduce_results((), num_players)
+        for task_result in engine.imap_unordered(task, chunks, cancel_token):
+            task_results.append(task_result)
+            if keep_runouts:
+                chunk_counts = [runout_counts for _, runout_counts in task_result]
+            else:
+                chunk_counts = (task_result[0] if hand_results is not None or class_results is not None
+                                else task_result,)
+            for task_counts in chunk_counts:
+                for index, count in enumerate(task_counts):
+                    counts[index] += count
+            progress(*unpack_results(counts, num_players), ordered_chunks and len(task_results) < len(chunks))
+    if keep_runouts:
+        # Tasks return the results of each runout instead, which add up to the totals
+        for task_runouts in task_results:
+            runout_results.update(task_runouts)
+        task_results = runout_results.values()
+    if hand_results is not None or class_results is not None:
+        # Tasks return their results along with the results of each hand they simulated
+        hands = [hand for hand, _ in hand_range] if hand_range is not None else \
+            list(holdem_utils.generate_pocket_cards(deck))
+        if task.func is runout_simulation:
+            # or with the wins and split pots against every holding over their runouts,
+            # each holding being dealt every runout of the cards left
+            hand_wins, hand_ties = ([sum(counts) for counts in zip(*task_counts)]
+                                    for task_counts in zip(*(task_hands for _, task_hands in task_results)))
+            num_deals = comb(len(deck) - 2, 5 - board_length)
+            simulated = list()
+            for index, hand in enumerate(hands):
+                holding = holdem_evaluator.holding_index(*hand)
+                simulated.append((index, hand_wins[holding], hand_ties[holding], num_deals))
+        else:
+            simulated = [hand_result for _, task_hands in task_results for hand_result in task_hands]
+        if hand_results is not None:
+            add_hand_results(hand_results, hands, group, permutation, simulated)
+        if class_results is not None:
+            for index, wins, ties, deals in simulated:
+                equity_results = class_results[unknown_hand_class(hands[index])]
+                equity_results[0] += wins + ties / 2
+                equity_results[1] += wins + ties / 4
+                equity_results[2] += deals
+        task_results = [counts for counts, _ in task_results]
 
-    # Go through each parallel data structure and aggregate results
-    combined_winner_list, combined_histograms = [0] * (num_players + 1), list()
+    return unpack_results(reduce_results(task_results, num_players), num_players)
 
-    for _ in range(num_players):
-        combined_histograms.append([0] * len(holdem_utils.HAND_RANKINGS))
-    for index, element in enumerate(winner_list):
-        combined_winner_list[index % (num_players + 1)] += element
-    for index, element in enumerate(result_probabilities):
-        combined_histograms[int((index / num_poker_hands) % num_players)][(index % num_poker_hands)] += element
 
-    # holdem_utils.print_results(pocket_cards, combined_winner_list, combined_histograms)
-    return holdem_utils.parse_result(pocket_cards, combined_winner_list, combined_histograms)
+def add_hand_results(hand_results: dict, hands: list, group: tuple, permutation: tuple, simulated: list):
+    """
+        Add up the results of every hand of an unknown hand, the hands left out
+        by the symmetries taking the results of the hand simulated in their place
+    :param hand_results: The results of each hand (see simulate), updated
+    :param hands: The hands of the unknown hand, in simulation order
+    :param group: The suit permutations of the simulation
+    :param permutation: The suit permutation applied to the spot (the hand strings are
+        in the original suits)
+    :param simulated: The (hand index, wins, ties, deals) of each hand simulated
+    """
+    simulated = {index: counts for index, *counts in simulated}
+    positions = {tuple(sorted(hand)): index for index, hand in enumerate(hands)} if len(group) > 1 else None
+    inverse = tuple(permutation.index(suit) for suit in range(holdem_evaluator.NUM_SUITS))
+    for index, hand in enumerate(hands):
+        counts = simulated[positions[min(holdem_canonical.orbit(hand, group))] if positions else index]
+        if isinstance(hand[0], int):
+            hand = holdem_evaluator.decode_card(hand[0] & ~3 | inverse[hand[0] & 3]) + \
+                holdem_evaluator.decode_card(hand[1] & ~3 | inverse[hand[1] & 3])
+        else:
+            hand = str(hand[0]) + str(hand[1])
+        totals = hand_results.setdefault(hand, [0, 0, 0])
+        for position, count in enumerate(counts):
+            totals[position] += count
+
 
+"""
+Task results are flat arrays of counters:
 
-def unknown_simulation_init(pocket_cards_list, unknown_index, deck_list,
-                            generate_all_boards, board_length, given_board, num_sims,
-                            combined_winner_list, combined_result_histograms):
+1) winner_list: Number of split pots, of times each player wins a hand and of
+    split pots each player shares (see holdem_utils.new_winner_list)
+2) result_histograms: For each player, the number of times each type of
+    poker hand (e.g. flush, straight) occurred
+"""
+
+
+def pack_results(winner_list: list, result_histograms: list) -> array:
+    """
+        Pack a task's results in one flat array
+    :param winner_list: The number of times each player won
+    :param result_histograms: The hand histogram of each player
+    :return: The packed results
+    """
+    counts = array('Q', winner_list)
+    for histogram in result_histograms:
+        counts.extend(histogram)
+    return counts
+
+
+def reduce_results(task_results, num_players: int) -> array:
     """
-        Initialize a simulation where opponent cards are unknown
+        Sum the packed results of all tasks
+    :param task_results: The packed results of each task
+    :param num_players: The number of players
+    :return: The combined packed results
     """
-    unknown_simulation.pocket_cards_list = pocket_cards_list
-    unknown_simulation.unknown_index = unknown_index
-    unknown_simulation.deck = deck_list
-    unknown_simulation.generate_all_boards = generate_all_boards
-    unknown_simulation.board_length = board_length
-    unknown_simulation.given_board = given_board
-    unknown_simulation.num_sims = num_sims
-    unknown_simulation.combined_winner_list = combined_winner_list
-    unknown_simulation.combined_result_histograms = combined_result_histograms
+    counts = array('Q', bytes(8 * (2 * num_players + 1 + num_players * len(holdem_utils.HAND_RANKINGS))))
+    for task_counts in task_results:
+        for index, count in enumerate(task_counts):
+            counts[index] += count
+    return counts
 
 
-def unknown_simulation(new_pocket_cards):
+def unpack_results(counts: array, num_players: int) -> tuple:
+    """
+        Unpack results packed by pack_results
+    :param counts: The packed results
+    :param num_players: The number of players
+    :return: The number of times each player won and the hand histogram of each player
+    """
+    num_poker_hands = len(holdem_utils.HAND_RANKINGS)
+    winner_list = list(counts[:2 * num_players + 1])
+    result_histograms = list()
+    for player_index in range(num_players):
+        start = 2 * num_players + 1 + player_index * num_poker_hands
+        result_histograms.append(list(counts[start:start + num_poker_hands]))
+    return winner_list, result_histograms
+
+
+def add_results(winner_list: list, result_histograms: list, other_winner_list: list, other_histograms: list):
+    """
+        Add some results to others
+    :param winner_list: The number of times each player won (updated)
+    :param result_histograms: The hand histogram of each player (updated)
+    :param other_winner_list: The number of times each player won to add
+    :param other_histograms: The hand histograms to add
+    """
+    for index, count in enumerate(other_winner_list):
+        winner_list[index] += count
+    for histogram, other_histogram in zip(result_histograms, other_histograms):
+        for index, count in enumerate(other_histogram):
+            histogram[index] += count
+
+
+def new_results(num_players: int) -> tuple:
+    """
+        Create empty results for a task
+    :param num_players: The number of players
+    :return: The number of times each player won and the hand histogram of each player
+    """
+    result_histograms = list()
+    for _ in range(num_players):
+        result_histograms.append([0] * len(holdem_utils.HAND_RANKINGS))
+    return holdem_utils.new_winner_list(num_players), result_histograms
+
+
+def unknown_simulation(context, pocket_cards_range):
     """
         Simulation where opponent cards are unknown
+    :param context: The request shared by every task (evaluator, hands, unknown hand index,
+        deck, board generator, board length, board, number of simulations, random seed,
+        suit symmetry group, (hand, weight) of each hand of the unknown hand's range or None,
+        whether to keep the results of each hand, the (boards per hand, board weight) keyed by
+        hand class and weight (see holdem_sampling.neyman_allocation) or None for num_sims
+        boards each)
+    :param pocket_cards_range: The (start, stop) of the unknown hands to simulate, out of
+        all possible hand cards in the deck (or the hands of the range)
+    :return: The packed results of the range, and when keeping them, the (hand index,
+        first known hand's wins, ties, deals) of each hand simulated
     """
     # Extract parameters
-    pocket_cards_list = unknown_simulation.pocket_cards_list
-    unknown_index = unknown_simulation.unknown_index
-    deck = unknown_simulation.deck[:]
-    generate_all_boards = unknown_simulation.generate_all_boards
-    board_length = unknown_simulation.board_length
-    given_board = unknown_simulation.given_board
-    num_sims = unknown_simulation.num_sims
-    combined_winner_list = unknown_simulation.combined_winner_list
-    combined_result_histograms = unknown_simulation.combined_result_histograms
+    (evaluator, pocket_cards, unknown_index, deck, generate_all_boards,
+     board_length, given_board, num_sims, seed, group, hand_range, keep_hands, hand_boards) = context
+    evaluator = EVALUATORS[evaluator]
+    start, stop = pocket_cards_range
 
     # Set simulation variables
-    num_players = len(pocket_cards_list)
-    result_histograms, winner_list = list(), [0] * (num_players + 1)
-    for _ in range(num_players):
-        result_histograms.append([0] * len(holdem_utils.HAND_RANKINGS))
-    pocket_cards_list[unknown_index] = new_pocket_cards
-    deck.remove(new_pocket_cards[0])
-    deck.remove(new_pocket_cards[1])
-
-    # Find winner
-    holdem_utils.find_winner(generate_all_boards, deck, tuple(pocket_cards_list),
-                             board_length, given_board, num_sims, winner_list,
-                             result_histograms)
-
-    # Write results to parallel data structure
-    proc_name = multiprocessing.current_process().name
-    proc_id = int(proc_name.split("-")[-1]) % multiprocessing.cpu_count()
-    for index, result in enumerate(winner_list):
-        combined_winner_list[proc_id * (num_players + 1) + index] += result
-    for histogram_index, histogram in enumerate(result_histograms):
-        for index, result in enumerate(histogram):
-            combined_result_histograms[len(holdem_utils.HAND_RANKINGS) *
-                                       (proc_id * num_players + histogram_index)
-                                       + index] += result
-
-
-def find_winner(generate_all_boards, deck, pocket_cards, board_length,
-                given_board, num_sims, winner_list, result_probabilities):
-    """
-        Determine the simulation winner
-    """
-    num_processes = multiprocessing.cpu_count()
-    # Create threadpool and use it to perform hand detection over all boards
-    pool = multiprocessing.Pool(processes=num_processes,
-                                initializer=simulation_init,
-                                initargs=(given_board, pocket_cards, winner_list,
-                                          result_probabilities))
-    pool.map(simulation, generate_all_boards(deck, num_sims, board_length))
-
-
-# Initialize shared variables for simulation
-def simulation_init(given_board, pocket_cards, winner_list, result_probabilities):
-    simulation.given_board = given_board
-    simulation.pocket_cards = pocket_cards
-    simulation.winner_list = winner_list
-    simulation.result_probabilities = result_probabilities
-
-
-# Separated function for each thread to execute while running
-def simulation(remaining_board):
-    # Extract variables shared through inheritance
-    given_board, pocket_cards = simulation.given_board, simulation.pocket_cards
-    winner_list = simulation.winner_list
-    result_probabilities = simulation.result_probabilities
-
-    # Generate a new board
-    if given_board:
-        board = given_board[:]
-        board.extend(remaining_board)
-    else:
-        board = remaining_board
-    num_players = len(pocket_cards)
+    winner_list, result_histograms = new_results(len(pocket_cards))
+    hand_results = list()
+    player_index = min(index for index, hand_card in enumerate(pocket_cards + ((),)) if index != unknown_index)
+    pocket_cards_list = list(pocket_cards)
+    if hand_range is None:
+        hand_range = ((new_pocket_cards, 1) for new_pocket_cards in holdem_utils.generate_pocket_cards(deck))
+    all_pocket_cards = enumerate(islice(hand_range, start, stop), start)
+    for index, (new_pocket_cards, range_weight) in all_pocket_cards:
+        # Only simulate one of the unknown hands the symmetries map onto each other
+        weight = orbit_size(new_pocket_cards, group) * range_weight
+        if not weight:
+            continue
+        hand_sims = num_sims
+        if hand_boards is not None:
+            hand_sims, board_weight = hand_boards[unknown_hand_class(new_pocket_cards), weight]
+            weight *= board_weight
+        pocket_cards_list[unknown_index] = new_pocket_cards
+        remaining_deck = list(deck)
+        remaining_deck.remove(new_pocket_cards[0])
+        remaining_deck.remove(new_pocket_cards[1])
 
-    # Extract process id from the name of the current process
-    # Names are of the format: PoolWorker-1 - PoolWorker-n
-    proc_name = multiprocessing.current_process().name
-    proc_id = int(proc_name.split("-")[-1]) % multiprocessing.cpu_count()
+        # Find winner
+        if keep_hands:
+            # The results against this hand on their own, then counted weight times
+            hand_winner_list, hand_histograms = new_results(len(pocket_cards))
+            holdem_utils.find_winner(evaluator, generate_all_boards, remaining_deck, tuple(pocket_cards_list),
+                                     board_length, given_board, hand_sims, hand_winner_list,
+                                     hand_histograms, seed + index * num_sims)
+            if player_index < len(pocket_cards):
+                player_results = (hand_winner_list[player_index + 1],
+                                  hand_winner_list[len(pocket_cards) + 1 + player_index])
+            else:
+                player_results = (0, 0)
+            hand_results.append((index, *player_results, holdem_utils.count_deals(hand_winner_list)))
+            add_results(winner_list, result_histograms, [count * weight for count in hand_winner_list],
+                        [[count * weight for count in histogram] for histogram in hand_histograms])
+        else:
+            holdem_utils.find_winner(evaluator, generate_all_boards, remaining_deck, tuple(pocket_cards_list),
+                                     board_length, given_board, hand_sims, winner_list,
+                                     result_histograms, seed + index * num_sims, weight)
+    if keep_hands:
+        return pack_results(winner_list, result_histograms), hand_results
+    return pack_results(winner_list, result_histograms)
 
-    # Create results data structure which tracks results of comparisons
-    result_list = list()
-    for _ in range(num_players):
-        result_list.append(list())
-
-    # Find the best possible poker hand given the created board and the
-    # hole cards and save them in the results data structures
-    suit_histogram, histogram, max_suit = (
-        holdem_utils.preprocess_board(board))
-    for index, hole_card in enumerate(pocket_cards):
-        result_list[index] = (
-            holdem_utils.detect_hand(hole_card, board, suit_histogram, histogram, max_suit))
-
-    # Find the winner of the hand and tabulate results
-    winner_index = holdem_utils.compare_hands(result_list)
-    winner_list[proc_id * (num_players + 1) + winner_index] += 1
-
-    # Increment what hand each player made
-    for index, result in enumerate(result_list):
-        result_probabilities[len(holdem_utils.HAND_RANKINGS) *
-                          (proc_id * num_players + index) + result[0]] += 1
+
+def multiway_simulation(context, deal_range):
+    """
+        Monte Carlo simulation where several opponent cards are unknown: each
+        deal draws the unknown hands and the missing board cards at once, as
+        one sample of distinct cards of the deck
+    :param context: The request shared by every task (evaluator, hands, deck, board length,
+        board, random seed)
+    :param deal_range: The (start, stop) of the deals to simulate
+    :return: The packed results of the range
+    """
+    evaluator, pocket_cards, deck, board_length, given_board, seed = context
+    evaluator = EVALUATORS[evaluator]
+    start, stop = deal_range
+    rng = random.Random(seed + start)
+
+    winner_list, result_histograms = new_results(len(pocket_cards))
+    unknown_seats = [index for index, hand_card in enumerate(pocket_cards) if hand_card == (None, None)]
+    num_hand_cards = 2 * len(unknown_seats)
+    num_dealt = num_hand_cards + 5 - board_length
+    hands = list(pocket_cards)
+    board = list(given_board or ())
+    result_list = [None] * len(hands)
+    for _ in range(start, stop):
+        dealt_cards = rng.sample(deck, num_dealt)
+        for position, index in enumerate(unknown_seats):
+            hands[index] = (dealt_cards[2 * position], dealt_cards[2 * position + 1])
+        board[board_length:] = dealt_cards[num_hand_cards:]
+        evaluator.evaluate_hands(hands, board, result_list)
+        holdem_utils.count_winner(result_list, winner_list)
+        for index, result in enumerate(result_list):
+            result_histograms[index][evaluator.hand_category(result)] += 1
+    return pack_results(winner_list, result_histograms)
+
+
+def runout_simulation(context, runout_range):
+    """
+        Exhaustive simulation where opponent cards are unknown, on integer
+        cards: each runout is dealt once and every unknown hand left in the
+        deck is ranked on it at once (see holdem_evaluator.count_holdings)
+    :param context: The request shared by every task (hands, unknown hand index, deck,
+        board length, board, suit symmetry group, whether to keep each runout's results,
+        whether to keep the results against each hand of the unknown hand)
+    :param runout_range: The (start, stop) of the runouts to simulate, out of all
+        runouts of the deck
+    :return: The packed results of the range, or the (sorted runout, packed results)
+        of each runout when keeping them. When keeping the results of each hand, the
+        packed results come with the first known hand's wins and split pots against
+        each holding (indexed as holdem_evaluator.HOLDINGS) over the range
+    """
+    (pocket_cards, unknown_index, deck, board_length, given_board, group, keep_runouts,
+     keep_hands) = context
+    start, stop = runout_range
+
+    winner_list, result_histograms = new_results(len(pocket_cards))
+    runout_results = list()
+    known_seats = [index for index, hand_card in enumerate(pocket_cards) if index != unknown_index]
+    known_hands = [pocket_cards[index] for index in known_seats]
+    # The remaining cards are always the deck minus the runout
+    rank_cache = dict()
+    if keep_hands:
+        holding_results = holdem_boards.HoldingResults(deck)
+    runouts = holdem_utils.generate_exhaustive_boards(deck, 0, board_length, start, stop)
+    for runout, weight in holdem_canonical.orbit_representatives(runouts, group):
+        if keep_runouts:
+            winner_list, result_histograms = new_results(len(pocket_cards))
+            orbit, weight = holdem_canonical.orbit(runout, group), 1
+        unknown_histogram = result_histograms[unknown_index]
+        board = list(given_board or ()) + list(runout)
+        remaining_deck = [card for card in deck if card not in runout]
+        num_holdings = weight * comb(len(remaining_deck), 2)
+
+        # The known hands make the same hand against every unknown hand
+        known_strengths = holdem_evaluator.evaluate_hands(known_hands, board)
+        best_strength = max(known_strengths)
+        best_seats = [index for index, strength in zip(known_seats, known_strengths) if strength == best_strength]
+        for index, strength in zip(known_seats, known_strengths):
+            result_histograms[index][strength >> holdem_evaluator.CATEGORY_SHIFT] += num_holdings
+
+        lower, equal, higher = 0, 0, 0
+        for strength, count in holdem_evaluator.count_holdings(board, remaining_deck, rank_cache).items():
+            count *= weight
+            unknown_histogram[strength >> holdem_evaluator.CATEGORY_SHIFT] += count
+            if strength > best_strength:
+                higher += count
+            elif strength == best_strength:
+                equal += count
+            else:
+                lower += count
+        winner_list[unknown_index + 1] += higher
+        holdem_utils.count_pot(winner_list, best_seats + [unknown_index], len(pocket_cards), equal)
+        holdem_utils.count_pot(winner_list, best_seats, len(pocket_cards), lower)
+        if keep_hands and known_strengths[0] == best_strength:
+            # The first known hand (the player) loses against every holding otherwise
+            holding_results.count(board, runout, best_strength, len(best_seats) > 1, weight)
+        if keep_runouts:
+            counts = pack_results(winner_list, result_histograms)
+            runout_results.extend((image, counts) for image in orbit)
+    if keep_hands:
+        return pack_results(winner_list, result_histograms), holding_results.results(group)
+    return runout_results if keep_runouts else pack_results(winner_list, result_histograms)
+
+
+def unknown_hand_class(hand) -> int:
+    """
+        Get the starting hand class of a hand of the unknown hand
+    :param hand: The two cards, integer cards or holdem_utils.Card instances
+    :return: The class index (see holdem_tables.hand_class)
+    """
+    first_card, second_card = hand
+    if not isinstance(first_card, int):
+        first_card, second_card = holdem_evaluator.encode_card(first_card), holdem_evaluator.encode_card(second_card)
+    return holdem_tables.hand_class(first_card, second_card)
+
+
+def orbit_size(cards, group) -> int:
+    """
+        Get the number of card sets a symmetry group maps some cards onto
+    :param cards: The integer cards
+    :param group: The suit permutations
+    :return: The orbit size, or 0 if the cards do not represent their orbit
+    """
+    for representative, weight in holdem_canonical.orbit_representatives((cards,), group):
+        return weight
+    return 0
+
+
+def count_runouts(evaluator, remaining_boards, pocket_cards, given_board, group, weight,
+                  winner_list, result_histograms):
+    """
+        Tally the results of some runouts, only evaluating one of the runouts
+        the symmetry group maps onto each other
+    :param evaluator: The evaluator module
+    :param remaining_boards: The runouts
+    :param pocket_cards: The players' hands
+    :param given_board: The game board
+    :param group: The suit permutations leaving the hands and the board unchanged
+    :param weight: The number of times each runout counts
+    :param winner_list: The number of times each player won
+    :param result_histograms: The hand histogram of each player
+    """
+    if len(group) == 1:
+        holdem_utils.count_winners(evaluator, remaining_boards, pocket_cards, given_board,
+                                   winner_list, result_histograms, weight)
+        return
+    runouts = holdem_canonical.orbit_representatives(remaining_boards, group)
+    for runout_weight, runouts in holdem_canonical.group_by_weight(runouts).items():
+        holdem_utils.count_winners(evaluator, runouts, pocket_cards, given_board,
+                                   winner_list, result_histograms, weight * runout_weight)
+
+
+def batch_simulation(context, deal_range):
+    """
+        Simulation of a range of deals evaluated in batches (see holdem_numpy.simulate_range)
+    :return: The packed results of the range
+    """
+    return pack_results(*holdem_numpy.simulate_range(context, deal_range))
+
+
+# Separated function for each worker to execute while running
+def simulation(context, board_range):
+    # Extract variables shared by every task of the request
+    (evaluator, given_board, pocket_cards, deck, generate_all_boards,
+     board_length, num_sims, seed, group, keep_runouts) = context
+    evaluator = EVALUATORS[evaluator]
+    start, stop = board_range
+
+    # Find the winner of every board in the range and what hand each player made
+    winner_list, result_histograms = new_results(len(pocket_cards))
+    remaining_boards = generate_all_boards(deck, num_sims, board_length, start, stop, seed)
+    if generate_all_boards is not holdem_utils.generate_exhaustive_boards:
+        group = (holdem_canonical.IDENTITY,)
+    if keep_runouts:
+        # The results of each runout, shared by every runout of its orbit
+        runout_results = list()
+        for runout, _ in holdem_canonical.orbit_representatives(remaining_boards, group):
+            winner_list, result_histograms = new_results(len(pocket_cards))
+            holdem_utils.count_winners(evaluator, (runout,), pocket_cards, given_board,
+                                       winner_list, result_histograms)
+            counts = pack_results(winner_list, result_histograms)
+            runout_results.extend((image, counts) for image in holdem_canonical.orbit(runout, group))
+        return runout_results
+    count_runouts(evaluator, remaining_boards, pocket_cards, given_board, group, 1,
+                  winner_list, result_histograms)
+    return pack_results(winner_list, result_histograms)
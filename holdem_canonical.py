@@ -0,0 +1,139 @@
+import holdem_evaluator
+
+from functools import lru_cache
+from itertools import permutations
+
+"""
+Suit isomorphism
+----------------
+Hold'em results do not change when the suits are relabelled, e.g. As Ts on
+Js 3c Qs is the same problem as Ah Th on Jh 3d Qh. Spots are therefore mapped
+to a canonical form, and enumerations only evaluate one member of each set of
+holdings/runouts that a suit permutation maps onto each other, weighted by the
+size of the set.
+
+Everything here works on integer cards (see holdem_evaluator). A suit
+permutation is a 4-tuple giving the new suit of each suit.
+"""
+
+SUIT_PERMUTATIONS = tuple(permutations(range(4)))
+IDENTITY = SUIT_PERMUTATIONS[0]
+
+
+def permute_cards(cards, permutation: tuple) -> tuple:
+    """
+        Relabel the suits of some cards
+    :param cards: The integer cards (None for unknown cards is kept)
+    :param permutation: The suit permutation
+    :return: The relabelled cards
+    """
+    return tuple(card if card is None else card & ~3 | permutation[card & 3] for card in cards)
+
+
+def _spot_form(pocket_cards, board, permutation) -> tuple:
+    # Hands and board as sets (sorted), unknown hands left empty
+    hands = tuple(tuple(sorted(permute_cards(hand_card, permutation), reverse=True))
+                  if None not in hand_card else () for hand_card in pocket_cards)
+    return hands, tuple(sorted(permute_cards(board or (), permutation), reverse=True))
+
+
+def canonical_permutation(pocket_cards, board) -> tuple:
+    """
+        Find the suit permutation mapping a spot onto its canonical form: the
+        smallest relabelling, with every hand and the board taken as sets
+    :param pocket_cards: The players' integer hand cards ((None, None) for unknown hands)
+    :param board: The integer board cards
+    :return: The suit permutation
+    """
+    return _canonical_permutation(tuple(map(tuple, pocket_cards)), tuple(board or ()))
+
+
+# A spot is usually canonicalised several times per request (cache key,
+# simulation), so the last spots are remembered
+@lru_cache(maxsize=4096)
+def _canonical_permutation(pocket_cards: tuple, board: tuple) -> tuple:
+    return min(SUIT_PERMUTATIONS, key=lambda permutation: _spot_form(pocket_cards, board, permutation))
+
+
+def canonical_spot(pocket_cards, board) -> tuple:
+    """
+        Map a spot onto its canonical form
+    :param pocket_cards: The players' integer hand cards ((None, None) for unknown hands)
+    :param board: The integer board cards
+    :return: The canonical hands (each sorted, unknown hands kept as (None, None)),
+        the canonical board (sorted) and the suit permutation applied
+    """
+    permutation = canonical_permutation(pocket_cards, board)
+    hands, canonical_board = _spot_form(pocket_cards, board, permutation)
+    hands = tuple(hand if hand else (None, None) for hand in hands)
+    return hands, list(canonical_board), permutation
+
+
+def stabilizer(pocket_cards, board, group=SUIT_PERMUTATIONS) -> tuple:
+    """
+        Find the suit permutations that leave every hand and the board unchanged
+    :param pocket_cards: The players' integer hand cards (unknown hands are ignored)
+    :param board: The integer board cards
+    :param group: The permutations to choose from
+    :return: The permutations (always including the identity)
+    """
+    known_sets = [frozenset(hand_card) for hand_card in pocket_cards if None not in hand_card]
+    known_sets.append(frozenset(board or ()))
+    return tuple(permutation for permutation in group
+                 if all(frozenset(permute_cards(cards, permutation)) == cards for cards in known_sets))
+
+
+def orbit_representatives(card_sets, group):
+    """
+        Keep only one card set out of each set of card sets that the group maps
+        onto each other. The representative is the smallest member of its orbit,
+        so any slice of an enumeration can be filtered on its own.
+    :param card_sets: The card sets (tuples of integer cards)
+    :param group: The suit permutations (a group, e.g. from stabilizer)
+    :return: Generator of (card set, orbit size)
+    """
+    if len(group) == 1:
+        for cards in card_sets:
+            yield cards, 1
+        return
+    card_images = _card_images(tuple(group))
+    for cards in card_sets:
+        form = tuple(sorted(cards))
+        images = set()
+        for card_image in card_images:
+            image = tuple(sorted(map(card_image.__getitem__, cards)))
+            if image < form:
+                break
+            images.add(image)
+        else:
+            yield cards, len(images)
+
+
+# The image of every card under each permutation of a group, as the same
+# groups keep filtering single hands
+@lru_cache(maxsize=64)
+def _card_images(group: tuple) -> list:
+    return [tuple(card & ~3 | permutation[card & 3] for card in range(holdem_evaluator.DECK_SIZE))
+            for permutation in group]
+
+
+def orbit(cards, group) -> set:
+    """
+        Get every card set the group maps some cards onto
+    :param cards: The integer cards
+    :param group: The suit permutations
+    :return: The card sets (as sorted tuples)
+    """
+    return {tuple(sorted(permute_cards(cards, permutation))) for permutation in group}
+
+
+def group_by_weight(weighted_card_sets) -> dict:
+    """
+        Group weighted card sets by their weight
+    :param weighted_card_sets: Iterable of (card set, weight)
+    :return: The card sets in list keyed by weight
+    """
+    groups = dict()
+    for cards, weight in weighted_card_sets:
+        groups.setdefault(weight, list()).append(cards)
+    return groups
@@ -0,0 +1,253 @@
+import atexit
+import multiprocessing
+import queue
+import threading
+import time
+
+from functools import partial
+
+# Number of work chunks handed to each worker per request, so that uneven
+# chunks still balance out across the pool
+CHUNKS_PER_PROCESS = 4
+# Cancellable requests are split in smaller chunks, so that they stop sooner
+CANCELLABLE_CHUNKS_PER_PROCESS = 16
+# How often (in seconds) a cancellable request checks its token while waiting for chunks
+CANCEL_CHECK_INTERVAL = 0.05
+
+
+class SimulationCancelled(Exception):
+    """
+        Raised when a request is stopped by its cancellation token
+    """
+
+
+class CancellationToken:
+    """
+        Lets the caller of a request stop it between two chunks of work. The
+        token is cancelled once cancel() is called, once its deadline has
+        passed, or once its parent token is cancelled, e.g.:
+
+            token = CancellationToken(timeout=2.0)
+            threading.Timer(0.5, token.cancel).start()
+            holdem_calculator.calculate_odds(['As', 'Ts', '?', '?'], [], exact=True, cancel_token=token)
+    """
+    def __init__(self, timeout: float = None, parent=None):
+        """
+        :param timeout: The time (in seconds) after which the token is cancelled (never if None)
+        :param parent: A token whose cancellation also cancels this one
+        """
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.parent = parent
+        self._event = threading.Event()
+
+    def cancel(self):
+        """
+            Cancel the token (the requests using it stop at their next check)
+        """
+        self._event.set()
+
+    @property
+    def timed_out(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    @property
+    def cancelled(self) -> bool:
+        return (self._event.is_set() or self.timed_out or
+                (self.parent is not None and self.parent.cancelled))
+
+    def check(self):
+        """
+            Raise SimulationCancelled if the token is cancelled
+        """
+        if self.cancelled:
+            raise SimulationCancelled('The simulation timed out.' if self.timed_out
+                                      else 'The simulation was cancelled.')
+
+
+class HoldemEngine:
+    """
+        Long-lived owner of the worker pool used by the simulations.
+        The pool is started on first use and reused by every request until the
+        engine is closed, e.g.:
+
+            with HoldemEngine(processes=4) as engine:
+                holdem_calculator.calculate_odds(['As', 'Ts', '?', '?'], [], engine=engine)
+    """
+    def __init__(self, processes: int = None):
+        """
+        :param processes: The number of worker processes (defaults to the cpu count,
+            0 runs every task in the calling process)
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if processes < 0:
+            raise ValueError('Number of processes cannot be negative.')
+        self.processes = processes
+        self._pool = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def num_chunks(self) -> int:
+        """
+            The number of chunks a request's work should be split in
+        """
+        return max(self.processes, 1) * CHUNKS_PER_PROCESS
+
+    @property
+    def num_cancellable_chunks(self) -> int:
+        """
+            The number of chunks a cancellable request's work should be split in
+        """
+        return max(self.processes, 1) * CANCELLABLE_CHUNKS_PER_PROCESS
+
+    def start(self):
+        """
+            Start the worker pool (if not already running)
+        """
+        if self._closed:
+            raise RuntimeError('The engine has been closed.')
+        if self._pool is None and self.processes:
+            self._pool = multiprocessing.Pool(processes=self.processes)
+
+    def map(self, func, iterable, cancel_token: CancellationToken = None) -> list:
+        """
+            Apply func to every item of iterable on the worker pool
+        :param func: A picklable function
+        :param iterable: The function arguments
+        :param cancel_token: Stop handing out items once the token is cancelled
+            (raising SimulationCancelled)
+        :return: The results in input order
+        """
+        self.start()
+        if cancel_token is None:
+            if self._pool is None:
+                return list(map(func, iterable))
+            return self._pool.map(func, iterable)
+        items = list(iterable)
+        results = [None] * len(items)
+        for index, result in self._run(func, items, cancel_token):
+            results[index] = result
+        return results
+
+    def imap_unordered(self, func, iterable, cancel_token: CancellationToken = None):
+        """
+            Apply func to every item of iterable on the worker pool, yielding
+            the results as they complete
+        :param func: A picklable function
+        :param iterable: The function arguments
+        :param cancel_token: Stop handing out items once the token is cancelled
+            (raising SimulationCancelled)
+        :return: Generator of the results in completion order
+        """
+        self.start()
+        for _, result in self._run(func, list(iterable), cancel_token):
+            yield result
+
+    def _run(self, func, items: list, cancel_token: CancellationToken):
+        # Yield the (index, result) of the items as they complete
+        if self._pool is None:
+            for index, item in enumerate(items):
+                if cancel_token is not None:
+                    cancel_token.check()
+                yield index, func(item)
+            return
+        # Only keep one item per worker in flight, so that a cancelled request
+        # leaves no queued work behind: the items already running finish (and
+        # are discarded), the others are never started
+        done = queue.Queue()
+        next_index, num_running = 0, 0
+        while next_index < len(items) or num_running:
+            if cancel_token is not None:
+                cancel_token.check()
+            while next_index < len(items) and num_running < self.processes:
+                self._pool.apply_async(func, (items[next_index],),
+                                       callback=partial(_put_result, done, next_index),
+                                       error_callback=partial(_put_error, done))
+                next_index += 1
+                num_running += 1
+            try:
+                index, result = done.get(timeout=CANCEL_CHECK_INTERVAL)
+            except queue.Empty:
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            num_running -= 1
+            yield index, result
+
+    def close(self):
+        """
+            Let the running tasks finish, then stop the workers
+        """
+        self._closed = True
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def terminate(self):
+        """
+            Stop the workers immediately
+        """
+        self._closed = True
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+
+def _put_result(done, index, result):
+    done.put((index, result))
+
+
+def _put_error(done, error):
+    done.put((None, error))
+
+
+def split_range(total: int, num_chunks: int) -> list:
+    """
+        Split range(total) in (at most) num_chunks contiguous ranges of similar size
+    :param total: The size of the range
+    :param num_chunks: The number of chunks
+    :return: The (start, stop) of each non-empty chunk
+    """
+    chunk_size = max(1, -(-total // num_chunks))
+    return [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+
+
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+
+def get_default_engine() -> HoldemEngine:
+    """
+        Get the engine shared by calls that do not provide their own. It is
+        created on first use and closed when the interpreter exits.
+    :return: The default engine
+    """
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None or _default_engine.closed:
+            _default_engine = HoldemEngine()
+        return _default_engine
+
+
+@atexit.register
+def shutdown_default_engine():
+    """
+        Close the default engine (if created)
+    """
+    if _default_engine is not None:
+        _default_engine.close()
@@ -0,0 +1,361 @@
+from array import array
+from itertools import combinations, combinations_with_replacement
+
+import holdem_utils
+
+"""
+Lookup-table hand evaluator
+---------------------------
+Cards are encoded as small integers: card = rank << 2 | suit, where rank
+goes from 0 (deuce) to 12 (ace) and suit follows holdem_utils.SUIT_INDEX.
+
+A 7-card hand is ranked by summing one precomputed key per card:
+- bits 0..15 hold four 4-bit suit counters, used to detect flushes
+- bits 16.. hold a base-5 rank histogram, used to look up non-flush hands
+
+Flushes are ranked through a table indexed by the 13-bit rank mask of the
+flush suit. Every hand strength is a single integer where a higher value
+means a better hand:
+
+    strength = category << 20 | rank1 << 16 | rank2 << 12 | ... | rank5
+
+category is the index of the hand in holdem_utils.HAND_RANKINGS and rank1..5
+are card values (2..14) ordered by significance, so the category of a
+strength is strength >> CATEGORY_SHIFT.
+"""
+
+NUM_RANKS = 13
+NUM_SUITS = 4
+DECK_SIZE = NUM_RANKS * NUM_SUITS
+
+CATEGORY_SHIFT = 20
+RANK_KEY_SHIFT = 16
+# Adding 3 to each suit counter sets its high bit once it reaches 5
+SUIT_COUNT_OFFSET = 0x3333
+SUIT_COUNT_MASK = 0x8888
+
+HIGH_CARD, PAIR, TWO_PAIR, THREE_OF_A_KIND, STRAIGHT, FLUSH, FULL_HOUSE, \
+    FOUR_OF_A_KIND, STRAIGHT_FLUSH, ROYAL_FLUSH = range(len(holdem_utils.HAND_RANKINGS))
+
+# Rank masks of every straight, from the highest (ace high) to the wheel
+STRAIGHT_MASKS = tuple((0b11111 << low, low + 6) for low in range(8, -1, -1)) + ((0b1000000001111, 5),)
+
+CARD_KEYS = tuple((5 ** (card >> 2)) << RANK_KEY_SHIFT | 1 << ((card & 3) << 2)
+                  for card in range(DECK_SIZE))
+RANK_BITS = tuple(1 << (card >> 2) for card in range(DECK_SIZE))
+RANK_KEYS = tuple(5 ** rank for rank in range(NUM_RANKS))
+# Every two-card holding, in combinations order (see holding_index)
+HOLDINGS = tuple(combinations(range(DECK_SIZE), 2))
+
+
+def encode_card(card) -> int:
+    """
+        Encode a holdem_utils.Card (or None for an unknown card)
+    :param card: The card
+    :return: The integer card (or None)
+    """
+    if card is None:
+        return None
+    return card.index
+
+
+def encode_cards(cards) -> list:
+    """
+        Encode a sequence of holdem_utils.Card
+    :param cards: The cards
+    :return: The integer cards in list
+    """
+    return [encode_card(card) for card in cards]
+
+
+def decode_card(card: int) -> str:
+    """
+        Get the string form of an integer card, e.g. "As"
+    :param card: The integer card
+    :return: The card string
+    """
+    return holdem_utils.NAME_STRING[12 - (card >> 2)] + holdem_utils.REVERSE_SUIT_INDEX[card & 3]
+
+
+def make_strength(category: int, ranks) -> int:
+    """
+        Pack a hand category and its tie-break card values in one integer
+    :param category: The index of the hand in HAND_RANKINGS
+    :param ranks: The card values (2..14) by significance, at most five
+    :return: The hand strength
+    """
+    strength = category
+    for index in range(5):
+        strength = strength << 4 | (ranks[index] if index < len(ranks) else 0)
+    return strength
+
+
+def hand_category(strength: int) -> int:
+    """
+        Get the index of a hand strength in HAND_RANKINGS
+    :param strength: The hand strength
+    :return: The hand category
+    """
+    return strength >> CATEGORY_SHIFT
+
+
+def find_straight(rank_mask: int):
+    """
+        Find the highest straight in a rank mask
+    :param rank_mask: The 13-bit mask of the ranks present
+    :return: The straight high card value, or None
+    """
+    for straight_mask, high_card in STRAIGHT_MASKS:
+        if rank_mask & straight_mask == straight_mask:
+            return high_card
+    return None
+
+
+def _flush_strength(rank_mask: int) -> int:
+    high_card = find_straight(rank_mask)
+    if high_card == 14:
+        return make_strength(ROYAL_FLUSH, ())
+    if high_card:
+        return make_strength(STRAIGHT_FLUSH, (high_card,))
+    values = [rank + 2 for rank in range(NUM_RANKS - 1, -1, -1) if rank_mask >> rank & 1]
+    return make_strength(FLUSH, values[:5])
+
+
+def _rank_strength(rank_counts: list) -> int:
+    # Card values grouped by frequency, highest first
+    groups = [[], [], [], [], []]
+    rank_mask = 0
+    for rank in range(NUM_RANKS - 1, -1, -1):
+        if rank_counts[rank]:
+            groups[rank_counts[rank]].append(rank + 2)
+            rank_mask |= 1 << rank
+    quads, trips, pairs, singles = groups[4], groups[3], groups[2], groups[1]
+
+    if quads:
+        return make_strength(FOUR_OF_A_KIND, (quads[0], max(trips + pairs + singles + quads[1:])))
+    if trips and (len(trips) > 1 or pairs):
+        return make_strength(FULL_HOUSE, (trips[0], max(trips[1:] + pairs)))
+    high_card = find_straight(rank_mask)
+    if high_card:
+        return make_strength(STRAIGHT, (high_card,))
+    if trips:
+        return make_strength(THREE_OF_A_KIND, [trips[0]] + singles[:2])
+    if len(pairs) > 1:
+        return make_strength(TWO_PAIR, (pairs[0], pairs[1], max(pairs[2:] + singles)))
+    if pairs:
+        return make_strength(PAIR, [pairs[0]] + singles[:3])
+    return make_strength(HIGH_CARD, singles[:5])
+
+
+def _build_rank_table(num_cards: int = 7) -> dict:
+    table = dict()
+    for ranks in combinations_with_replacement(range(NUM_RANKS), num_cards):
+        rank_counts = [0] * NUM_RANKS
+        for rank in ranks:
+            rank_counts[rank] += 1
+        if max(rank_counts) > 4:
+            continue
+        table[sum(5 ** rank for rank in ranks)] = _rank_strength(rank_counts)
+    return table
+
+
+# Strength of every hand without a flush, keyed by its base-5 rank histogram
+RANK_TABLE = _build_rank_table()
+# Strength of every flush, indexed by the rank mask of the flush suit
+FLUSH_TABLE = tuple(_flush_strength(mask) if bin(mask).count('1') >= 5 else 0
+                    for mask in range(1 << NUM_RANKS))
+
+
+def evaluate(cards) -> int:
+    """
+        Rank a 7-card hand
+    :param cards: The seven integer cards
+    :return: The hand strength
+    """
+    key = 0
+    for card in cards:
+        key += CARD_KEYS[card]
+    return _evaluate_key(key, cards)
+
+
+def _evaluate_key(key: int, cards) -> int:
+    flush = (key + SUIT_COUNT_OFFSET) & SUIT_COUNT_MASK
+    if flush:
+        flush_suit = (flush.bit_length() >> 2) - 1
+        rank_mask = 0
+        for card in cards:
+            if card & 3 == flush_suit:
+                rank_mask |= RANK_BITS[card]
+        return FLUSH_TABLE[rank_mask]
+    return RANK_TABLE[key >> RANK_KEY_SHIFT]
+
+
+def _flush_hand_strength(flush: int, board, first_card: int, second_card: int) -> int:
+    # The strength of a flush hand, read from its cards in place
+    flush_suit = (flush.bit_length() >> 2) - 1
+    rank_mask = 0
+    for card in board:
+        if card & 3 == flush_suit:
+            rank_mask |= RANK_BITS[card]
+    if first_card & 3 == flush_suit:
+        rank_mask |= RANK_BITS[first_card]
+    if second_card & 3 == flush_suit:
+        rank_mask |= RANK_BITS[second_card]
+    return FLUSH_TABLE[rank_mask]
+
+
+def evaluate_hands(pocket_cards, board, result_list: list = None) -> list:
+    """
+        Rank the hand of every player on a complete board
+    :param pocket_cards: The players' integer hand cards
+    :param board: The five integer board cards
+    :param result_list: The list the strengths are written to (one item per
+        player), so that loops over many boards reuse it. A new list if None
+    :return: The strength of each player's hand
+    """
+    board_key = 0
+    for card in board:
+        board_key += CARD_KEYS[card]
+    if result_list is None:
+        result_list = [0] * len(pocket_cards)
+    index = 0
+    for first_card, second_card in pocket_cards:
+        key = board_key + CARD_KEYS[first_card] + CARD_KEYS[second_card]
+        flush = (key + SUIT_COUNT_OFFSET) & SUIT_COUNT_MASK
+        if flush:
+            result_list[index] = _flush_hand_strength(flush, board, first_card, second_card)
+        else:
+            result_list[index] = RANK_TABLE[key >> RANK_KEY_SHIFT]
+        index += 1
+    return result_list
+
+
+def holding_index(first_card: int, second_card: int) -> int:
+    """
+        Get the index of a holding in HOLDINGS
+    :param first_card: One integer card of the holding
+    :param second_card: The other one
+    :return: The index
+    """
+    if first_card > second_card:
+        first_card, second_card = second_card, first_card
+    return first_card * (2 * DECK_SIZE - first_card - 1) // 2 + second_card - first_card - 1
+
+
+def holding_strengths(board) -> array:
+    """
+        Rank every two-card holding on a complete board. Unless the board is a
+        flush, holdings without a card of a suit the board can make a flush in
+        are looked up by their ranks alone
+    :param board: The five integer board cards
+    :return: The strength of each holding of HOLDINGS (0 for the holdings sharing
+        a card with the board)
+    """
+    board_key, board_mask = 0, 0
+    for card in board:
+        board_key += CARD_KEYS[card]
+        board_mask |= 1 << card
+    suit_counts = [board_key >> (suit << 2) & 0xF for suit in range(NUM_SUITS)]
+    flush_suit = max(range(NUM_SUITS), key=suit_counts.__getitem__)
+    board_flush = suit_counts[flush_suit] == 5
+    if suit_counts[flush_suit] < 3:
+        flush_suit = None
+    board_rank_key = board_key >> RANK_KEY_SHIFT
+    board = list(board)
+    strengths = array('l', bytes(array('l').itemsize * len(HOLDINGS)))
+    for index, (first_card, second_card) in enumerate(HOLDINGS):
+        if board_mask >> first_card & 1 or board_mask >> second_card & 1:
+            continue
+        if board_flush or first_card & 3 == flush_suit or second_card & 3 == flush_suit:
+            strengths[index] = _evaluate_key(board_key + CARD_KEYS[first_card] + CARD_KEYS[second_card],
+                                             board + [first_card, second_card])
+        else:
+            strengths[index] = RANK_TABLE[board_rank_key + RANK_KEYS[first_card >> 2] + RANK_KEYS[second_card >> 2]]
+    return strengths
+
+
+def count_holdings(board, cards, rank_cache: dict = None) -> dict:
+    """
+        Count the strengths of every two-card holding out of some cards on a
+        complete board. Holdings that cannot make a flush only depend on their
+        ranks, so they are ranked once per pair of ranks and counted by the
+        number of holdings of that pair
+    :param board: The five integer board cards
+    :param cards: The integer cards the holdings are dealt from
+    :param rank_cache: Dict keeping the counts by pair of ranks across calls, keyed
+        by the board ranks (only valid while cards are always the same set of
+        cards minus the board)
+    :return: The number of holdings of each strength, keyed by strength (not to
+        be modified, it may be shared with rank_cache)
+    """
+    board_key = 0
+    for card in board:
+        board_key += CARD_KEYS[card]
+
+    # Only a suit with at least three board cards can make a flush, with
+    # (5 - its board cards) of the holding's cards
+    suit_counts = [board_key >> (suit << 2) & 0xF for suit in range(NUM_SUITS)]
+    flush_suit = max(range(NUM_SUITS), key=suit_counts.__getitem__)
+    flush_cards_needed = 5 - suit_counts[flush_suit]
+    if flush_cards_needed > 2:
+        cache_key = board_key >> RANK_KEY_SHIFT
+    else:
+        flush_mask = 0
+        for card in board:
+            if card & 3 == flush_suit:
+                flush_mask |= RANK_BITS[card]
+        cache_key = board_key >> RANK_KEY_SHIFT, flush_suit, flush_mask
+    counts = None if rank_cache is None else rank_cache.get(cache_key)
+    if counts is None:
+        counts = _count_rank_holdings(board_key, cards, flush_suit, flush_cards_needed)
+        if rank_cache is not None:
+            rank_cache[cache_key] = counts
+    if flush_cards_needed > 2:
+        return counts
+
+    # Holdings that can make a flush only depend on their flush suit cards
+    counts = dict(counts)
+    flush_cards = [card for card in cards if card & 3 == flush_suit]
+    num_other_cards = len(cards) - len(flush_cards)
+    if flush_cards_needed <= 0:
+        strength = FLUSH_TABLE[flush_mask]
+        counts[strength] = counts.get(strength, 0) + num_other_cards * (num_other_cards - 1) // 2
+    if flush_cards_needed <= 1:
+        for card in flush_cards:
+            strength = FLUSH_TABLE[flush_mask | RANK_BITS[card]]
+            counts[strength] = counts.get(strength, 0) + num_other_cards
+    for first_card, second_card in combinations(flush_cards, 2):
+        strength = FLUSH_TABLE[flush_mask | RANK_BITS[first_card] | RANK_BITS[second_card]]
+        counts[strength] = counts.get(strength, 0) + 1
+    return counts
+
+
+def _count_rank_holdings(board_key: int, cards, flush_suit: int, flush_cards_needed: int) -> dict:
+    # Counts of the holdings that cannot make a flush, by pair of ranks: the
+    # flush suit cards are left out when one of them is enough, and the
+    # two-card flushes are taken out of the suited pairs when two are needed
+    if flush_cards_needed <= 0:
+        return dict()
+    rank_counts, excluded_counts = [0] * NUM_RANKS, [0] * NUM_RANKS
+    for card in cards:
+        if card & 3 != flush_suit or flush_cards_needed > 1:
+            rank_counts[card >> 2] += 1
+        if card & 3 == flush_suit and flush_cards_needed == 2:
+            excluded_counts[card >> 2] += 1
+
+    counts = dict()
+    board_rank_key = board_key >> RANK_KEY_SHIFT
+    ranks = [rank for rank in range(NUM_RANKS) if rank_counts[rank]]
+    for index, first_rank in enumerate(ranks):
+        first_count = rank_counts[first_rank]
+        first_key = board_rank_key + RANK_KEYS[first_rank]
+        if first_count > 1:
+            strength = RANK_TABLE[first_key + RANK_KEYS[first_rank]]
+            counts[strength] = counts.get(strength, 0) + first_count * (first_count - 1) // 2
+        for second_rank in ranks[index + 1:]:
+            num_holdings = first_count * rank_counts[second_rank] - \
+                excluded_counts[first_rank] * excluded_counts[second_rank]
+            if num_holdings:
+                strength = RANK_TABLE[first_key + RANK_KEYS[second_rank]]
+                counts[strength] = counts.get(strength, 0) + num_holdings
+    return counts
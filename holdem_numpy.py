@@ -0,0 +1,242 @@
+import holdem_evaluator
+import holdem_utils
+
+from itertools import combinations, islice
+from math import comb
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""
+Vectorized evaluator
+--------------------
+Evaluates whole batches of 7-card hands with NumPy array operations, using
+the integer cards and the strengths of holdem_evaluator: each batch is an
+integer array (hands x cards) and results are reduced with bincount.
+
+NumPy is optional: the module imports without it, but simulating raises
+RuntimeError.
+
+Per-board evaluation (evaluate_hands / hand_category) is delegated to
+holdem_evaluator, whose strengths are identical.
+"""
+
+# Number of hands evaluated per array operation
+BATCH_SIZE = 1 << 16
+
+evaluate_hands = holdem_evaluator.evaluate_hands
+hand_category = holdem_evaluator.hand_category
+
+_tables = None
+
+
+def available() -> bool:
+    """
+        Check whether NumPy is installed
+    """
+    return numpy is not None
+
+
+def _get_tables() -> tuple:
+    # The holdem_evaluator tables as arrays (built on first use)
+    global _tables
+    if _tables is None:
+        if numpy is None:
+            raise RuntimeError('The numpy evaluator requires NumPy.')
+        rank_keys = numpy.array(sorted(holdem_evaluator.RANK_TABLE), dtype=numpy.int64)
+        rank_strengths = numpy.array([holdem_evaluator.RANK_TABLE[key] for key in rank_keys.tolist()],
+                                     dtype=numpy.int64)
+        _tables = (numpy.array(holdem_evaluator.CARD_KEYS, dtype=numpy.int64),
+                   numpy.array(holdem_evaluator.RANK_BITS, dtype=numpy.int64),
+                   rank_keys, rank_strengths,
+                   numpy.array(holdem_evaluator.FLUSH_TABLE, dtype=numpy.int64))
+    return _tables
+
+
+def evaluate(cards):
+    """
+        Rank a batch of 7-card hands
+    :param cards: Integer array of shape (hands, 7)
+    :return: The strength of each hand (int64 array)
+    """
+    card_keys, rank_bits, rank_keys, rank_strengths, flush_table = _get_tables()
+    keys = card_keys[cards].sum(axis=1)
+    strengths = rank_strengths[numpy.searchsorted(rank_keys, keys >> holdem_evaluator.RANK_KEY_SHIFT)]
+    flushes = (keys + holdem_evaluator.SUIT_COUNT_OFFSET) & holdem_evaluator.SUIT_COUNT_MASK
+    flush_rows = numpy.nonzero(flushes)[0]
+    if flush_rows.size:
+        # The counter of the flush suit is the only one with its high bit set
+        flush_suits = numpy.searchsorted(numpy.array([0x8, 0x80, 0x800, 0x8000]), flushes[flush_rows])
+        flush_cards = cards[flush_rows]
+        suited = (flush_cards & 3) == flush_suits[:, None]
+        rank_masks = (rank_bits[flush_cards] * suited).sum(axis=1)
+        strengths[flush_rows] = flush_table[rank_masks]
+    return strengths
+
+
+def count_results(strengths, weights=None):
+    """
+        Reduce the strengths of every player on a batch of boards
+    :param strengths: Int64 array of shape (boards, players)
+    :param weights: The number of times each board counts (all once if None)
+    :return: The number of times each player won (see holdem_utils.new_winner_list) and the
+        hand histogram of each player
+    """
+    num_players = strengths.shape[1]
+    num_poker_hands = len(holdem_utils.HAND_RANKINGS)
+    best = strengths.max(axis=1)
+    is_best = strengths == best[:, None]
+    num_best = is_best.sum(axis=1)
+    winners = numpy.where(num_best > 1, 0, is_best.argmax(axis=1) + 1)
+    # The players sharing each split pot
+    splits = is_best & (num_best > 1)[:, None]
+    winner_list = numpy.concatenate((numpy.bincount(winners, weights, minlength=num_players + 1),
+                                     splits.sum(axis=0) if weights is None else weights @ splits))
+    categories = strengths >> holdem_evaluator.CATEGORY_SHIFT
+    result_histograms = [numpy.bincount(categories[:, index], weights, minlength=num_poker_hands)
+                         for index in range(num_players)]
+    return ([int(count) for count in winner_list],
+            [[int(count) for count in histogram] for histogram in result_histograms])
+
+
+def _player_hands(pocket_cards, board, dealt_cards):
+    # (boards, players, 7) cards: board, dealt cards and each player's hand.
+    # Unknown hands take the first dealt cards, two each
+    num_boards = dealt_cards.shape[0]
+    known_board = numpy.broadcast_to(numpy.array(board, dtype=numpy.int64), (num_boards, len(board)))
+    num_unknown = 2 * sum(1 for hand_card in pocket_cards if None in hand_card)
+    full_board = numpy.concatenate((known_board, dealt_cards[:, num_unknown:]), axis=1)
+    hands, unknown_index = list(), 0
+    for hand_card in pocket_cards:
+        if None in hand_card:
+            hand = dealt_cards[:, unknown_index:unknown_index + 2]
+            unknown_index += 2
+        else:
+            hand = numpy.broadcast_to(numpy.array(hand_card, dtype=numpy.int64), (num_boards, 2))
+        hands.append(numpy.concatenate((full_board, hand), axis=1))
+    return numpy.stack(hands, axis=1)
+
+
+def evaluate_players(pocket_cards, board, dealt_cards):
+    """
+        Rank every player's hand on a batch of deals
+    :param pocket_cards: The players' integer hand cards ((None, None) for unknown hands)
+    :param board: The known integer board cards
+    :param dealt_cards: Integer array (deals, cards): two cards per unknown hand
+        (in seat order) followed by the missing board cards
+    :return: The strengths, int64 array of shape (deals, players)
+    """
+    hands = _player_hands(pocket_cards, board, dealt_cards)
+    num_deals, num_players = hands.shape[:2]
+    return evaluate(hands.reshape(num_deals * num_players, 7)).reshape(num_deals, num_players)
+
+
+def random_deals(rng, deck, num_deals: int, num_cards: int):
+    """
+        Deal num_cards distinct random cards from the deck, num_deals times
+    :param rng: A numpy.random.Generator
+    :param deck: The integer deck
+    :param num_deals: The number of deals
+    :param num_cards: The number of cards per deal
+    :return: Integer array of shape (deals, cards)
+    """
+    # Partial Fisher-Yates shuffle of every row at once
+    deck = numpy.array(deck, dtype=numpy.int64)
+    order = numpy.tile(numpy.arange(len(deck), dtype=numpy.int16), (num_deals, 1))
+    rows = numpy.arange(num_deals)
+    for position in range(num_cards):
+        swaps = rng.integers(position, len(deck), size=num_deals)
+        chosen = order[rows, swaps]
+        order[rows, swaps] = order[:, position]
+        order[:, position] = chosen
+    return deck[order[:, :num_cards]]
+
+
+def _card_batches(card_sets, num_cards: int):
+    # Arrays (sets, cards) of up to BATCH_SIZE card sets out of an iterable
+    card_sets = iter(card_sets)
+    while True:
+        batch = list(islice(card_sets, BATCH_SIZE))
+        if not batch:
+            return
+        yield numpy.array(batch, dtype=numpy.int64).reshape(len(batch), num_cards)
+
+
+def exhaustive_deals(deck, num_unknown: int, num_board_cards: int, start: int, stop: int):
+    """
+        Enumerate the deals start..stop in batches of about BATCH_SIZE deals:
+        with one unknown hand, every hand out of the deck combined with every
+        runout of the remaining cards, otherwise every runout. The enumeration
+        is streamed, so memory does not grow with the number of deals
+    :param deck: The integer deck
+    :param num_unknown: The number of unknown hands (0 or 1)
+    :param num_board_cards: The number of missing board cards
+    :param start: The first hand (or runout) index
+    :param stop: The last hand (or runout) index (excluded)
+    :return: Generator of integer arrays of shape (deals, cards)
+    """
+    if not num_unknown:
+        yield from _card_batches(islice(combinations(deck, num_board_cards), start, stop), num_board_cards)
+        return
+    if num_unknown > 1:
+        raise ValueError('Exhaustive deals support at most one unknown hand.')
+    # Small runout sets of consecutive hands are gathered into one batch
+    batch, batch_size = list(), 0
+    for hand in islice(combinations(deck, 2), start, stop):
+        remaining_deck = [card for card in deck if card not in hand]
+        for runouts in _card_batches(combinations(remaining_deck, num_board_cards), num_board_cards):
+            hands = numpy.broadcast_to(numpy.array(hand, dtype=numpy.int64), (len(runouts), 2))
+            batch.append(numpy.concatenate((hands, runouts), axis=1))
+            batch_size += len(runouts)
+            if batch_size >= BATCH_SIZE:
+                yield numpy.concatenate(batch)
+                batch, batch_size = list(), 0
+    if batch:
+        yield numpy.concatenate(batch)
+
+
+def count_deals(deck, num_unknown: int, num_board_cards: int, num_sims: int, exhaustive: bool) -> int:
+    """
+        Get the size of the range a simulation is split over: the number of
+        hands (one unknown hand) or runouts for exhaustive simulations, the
+        number of random deals otherwise (num_sims per possible hand of an
+        unknown hand, as the per-board simulations do)
+    """
+    if exhaustive:
+        return comb(len(deck), 2) if num_unknown else comb(len(deck), num_board_cards)
+    return num_sims * comb(len(deck), 2) if num_unknown else num_sims
+
+
+def simulate_range(context, deal_range):
+    """
+        Simulate the deals of a range in batches
+    :param context: The request shared by every task (hands, board, deck, exhaustive, random seed)
+    :param deal_range: The (start, stop) of the range (see count_deals)
+    :return: The number of times each player won and the hand histogram of each player
+    """
+    pocket_cards, board, deck, exhaustive, seed = context
+    board = list(board or ())
+    num_unknown = sum(1 for hand_card in pocket_cards if None in hand_card)
+    num_board_cards = 5 - len(board)
+    start, stop = deal_range
+    rng = numpy.random.default_rng(seed + start)
+
+    winner_list, result_histograms = holdem_utils.new_winner_list(len(pocket_cards)), list()
+    for _ in pocket_cards:
+        result_histograms.append([0] * len(holdem_utils.HAND_RANKINGS))
+    if exhaustive:
+        batches = exhaustive_deals(deck, num_unknown, num_board_cards, start, stop)
+    else:
+        batches = (random_deals(rng, deck, min(batch_start + BATCH_SIZE, stop) - batch_start,
+                                2 * num_unknown + num_board_cards)
+                   for batch_start in range(start, stop, BATCH_SIZE))
+    for dealt_cards in batches:
+        batch_winner_list, batch_histograms = count_results(evaluate_players(pocket_cards, board, dealt_cards))
+        for index, count in enumerate(batch_winner_list):
+            winner_list[index] += count
+        for histogram, batch_histogram in zip(result_histograms, batch_histograms):
+            for index, count in enumerate(batch_histogram):
+                histogram[index] += count
+    return winner_list, result_histograms
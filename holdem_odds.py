@@ -2,8 +2,16 @@ from tkinter import Tk, Button, Frame
 from tkinter.ttk import Style, Label, Separator
 from PIL import ImageTk, Image
 from pprint import pprint, pformat
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
 
 from holdem_calculator import calculate_odds
+from holdem_engine import CancellationToken, SimulationCancelled
+
+# How often (in ms) the main loop picks up the results of the background calculations
+POLL_INTERVAL = 50
+# Standard error (in percentage points) Monte Carlo estimates are refined to
+TARGET_ERROR = 0.2
 
 
 class DeckCard:
@@ -42,13 +50,32 @@ class HoldemUI(Frame):
     def __init__(self):
         super().__init__()
 
+        # Calculations run on a background thread, one at a time, and hand their
+        # results to the main loop through a queue. Each one is tagged with the
+        # request it answers so that superseded results are dropped
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._future = None
+        self._cancel_token = None
+        self._request = 0
+        self._responses = Queue()
+
         self._init_ui()
+        self.after(POLL_INTERVAL, self._poll_responses)
+
+    def destroy(self):
+        """
+            Drop the pending calculations and close the window
+        """
+        self._supersede()
+        self._executor.shutdown(wait=False)
+        super().destroy()
 
     def _reset(self):
         """
             Reset the application
         :return:
         """
+        self._supersede()
         # Reset slots
         for _index, _card_slot in enumerate(self.card_slots):
             if _card_slot.deck_card is None:
@@ -97,18 +124,68 @@ class HoldemUI(Frame):
 
         return _pocket, _board
 
-    def _calculate(self, _pocket, _board):
+    def _submit(self, _pocket, _board):
         """
-            If parameters are valid, calculate hand odds
+            If parameters are valid, start calculating the hand odds in the
+            background, superseding the calculation in progress
         :param _pocket: The player pocket
         :param _board: The hand board
-        :return: The odds response
         """
+        self._supersede()
         if _pocket and len(_pocket) == 2:
-            _pocket.extend(['?', '?'])
-            if not _board or len(_board) < 3:
-                _board = list()
-            return calculate_odds(_pocket, _board)
+            self._cancel_token = CancellationToken()
+            self._future = self._executor.submit(self._calculate, self._request, _pocket, _board,
+                                                 self._cancel_token)
+
+    def _supersede(self):
+        """
+            Cancel the calculation in progress and drop its results
+        """
+        self._request += 1
+        if self._future is not None:
+            self._future.cancel()
+            self._cancel_token.cancel()
+            self._future = None
+
+    def _calculate(self, _request, _pocket, _board, _cancel_token):
+        """
+            Calculate hand odds (on the background thread), queueing the
+            refined Monte Carlo estimates as they come and the final odds (the
+            partial results of enumerations are not estimates, so they are skipped)
+        :param _request: The request the calculation answers
+        :param _pocket: The player pocket
+        :param _board: The hand board
+        :param _cancel_token: The token cancelled when the request is superseded
+        """
+        _pocket.extend(['?', '?'])
+        if not _board or len(_board) < 3:
+            _board = list()
+
+        def _queue_progress(_response):
+            if not _response['partial']:
+                self._responses.put((_request, _response))
+        try:
+            calculation_response = calculate_odds(_pocket, _board, target_error=TARGET_ERROR,
+                                                  progress=_queue_progress, cancel_token=_cancel_token)
+        except SimulationCancelled:
+            return
+        self._responses.put((_request, calculation_response))
+
+    def _poll_responses(self):
+        """
+            Show the latest odds of the current request, then poll again
+        """
+        calculation_response = None
+        while True:
+            try:
+                _request, _response = self._responses.get_nowait()
+            except Empty:
+                break
+            if _request == self._request:
+                calculation_response = _response
+        if calculation_response:
+            self._show_odds(calculation_response)
+        self.after(POLL_INTERVAL, self._poll_responses)
 
     def _card_click(self, picked_card):
         """
@@ -147,8 +224,13 @@ class HoldemUI(Frame):
 
         # Check if calculation can be called
         _pocket, _board = self._get_hand_details()
+        self._submit(_pocket, _board)
 
-        calculation_response = self._calculate(_pocket, _board)
+    def _show_odds(self, calculation_response):
+        """
+            Update the odds labels
+        :param calculation_response: The odds response
+        """
         pprint(calculation_response)
         if calculation_response:
             self.win_odds_label.configure(text='{}%'.format(calculation_response['game_odds']['win']))
@@ -0,0 +1,146 @@
+import holdem_canonical
+import holdem_evaluator
+import holdem_utils
+
+from itertools import combinations
+from re import compile
+
+"""
+Hand ranges
+-----------
+An unknown hand can be restricted to a range of hands in the usual notation,
+a comma separated list of:
+
+- pairs: QQ, QQ+ (QQ, KK, AA), 22-55
+- suited/offsuit hands: AKs, AKo, AK (both), ATo+ (ATo up to AKo), A2s-A5s
+- single hands: AsKs
+
+each optionally weighted, e.g. "QQ+, AKs:0.5, 76s:0.25" (weights default to
+1; a hand listed twice keeps its last weight).
+
+A parsed range maps each hand (its two integer cards, see holdem_evaluator,
+highest first) to its weight. The simulations go through the hands of the
+range left in the deck (see range_combos) the way they go through every
+possible hand of an unknown hand, each one counting as many times as its
+weight in units of 1 / RANGE_WEIGHT_SCALE.
+"""
+
+RANK_NAMES = holdem_utils.NAME_STRING[::-1]
+# Weights are counted in units of 1 / RANGE_WEIGHT_SCALE
+RANGE_WEIGHT_SCALE = 100
+
+_RANK = '[2-9TJQKA]'
+_HANDS_RE = compile('^({0})({0})([so]?)(\\+?)$'.format(_RANK))
+_SPAN_RE = compile('^({0})({0})([so]?)-({0})({0})([so]?)$'.format(_RANK))
+_SINGLE_RE = compile('^({0}[scdh])({0}[scdh])$'.format(_RANK))
+
+
+def parse_range(range_string: str) -> dict:
+    """
+        Parse a hand range
+    :param range_string: The range, e.g. "QQ+, AKs, ATo+:0.5"
+    :return: The weight of each hand of the range, keyed by its integer cards
+    """
+    hand_range = dict()
+    for token in range_string.replace(' ', '').split(','):
+        if not token:
+            continue
+        hands, _, weight = token.partition(':')
+        try:
+            weight = float(weight) if weight else 1.0
+        except ValueError:
+            raise ValueError('Invalid hand range weight: {}'.format(token))
+        if weight < 0:
+            raise ValueError('Hand range weights cannot be negative: {}'.format(token))
+        for hand in _parse_hands(hands):
+            hand_range[hand] = weight
+    if not hand_range:
+        raise ValueError('Empty hand range: {}'.format(range_string))
+    return hand_range
+
+
+def _parse_hands(token: str) -> list:
+    # The hands of a token of a range (without its weight)
+    single = _SINGLE_RE.match(token)
+    if single:
+        cards = [holdem_evaluator.encode_card(holdem_utils.Card(card)) for card in single.groups()]
+        if cards[0] == cards[1]:
+            raise ValueError('Invalid hand range: {}'.format(token))
+        return [tuple(sorted(cards, reverse=True))]
+    hands = _HANDS_RE.match(token)
+    if hands:
+        high, low, suitedness, plus = hands.groups()
+        high, low = sorted((RANK_NAMES.index(high), RANK_NAMES.index(low)), reverse=True)
+        if high == low:
+            if suitedness:
+                raise ValueError('Invalid hand range: {}'.format(token))
+            ranks = [(rank, rank) for rank in range(low, 13 if plus else low + 1)]
+        else:
+            ranks = [(high, rank) for rank in range(low, high if plus else low + 1)]
+        return [hand for high, low in ranks for hand in _rank_hands(high, low, suitedness)]
+    span = _SPAN_RE.match(token)
+    if span:
+        first_high, first_low, first_suitedness, last_high, last_low, last_suitedness = span.groups()
+        first = sorted((RANK_NAMES.index(first_high), RANK_NAMES.index(first_low)), reverse=True)
+        last = sorted((RANK_NAMES.index(last_high), RANK_NAMES.index(last_low)), reverse=True)
+        if first_suitedness != last_suitedness:
+            raise ValueError('Invalid hand range: {}'.format(token))
+        if first[0] == first[1] and last[0] == last[1] and not first_suitedness:
+            ranks = [(rank, rank) for rank in range(min(first[0], last[0]), max(first[0], last[0]) + 1)]
+        elif first[0] == last[0] and first[0] not in (first[1], last[1]):
+            ranks = [(first[0], rank) for rank in range(min(first[1], last[1]), max(first[1], last[1]) + 1)]
+        else:
+            raise ValueError('Invalid hand range: {}'.format(token))
+        return [hand for high, low in ranks for hand in _rank_hands(high, low, first_suitedness)]
+    raise ValueError('Invalid hand range: {}'.format(token))
+
+
+def _rank_hands(high: int, low: int, suitedness: str) -> list:
+    # Every hand of two ranks: suited (s), offsuit (o) or both
+    hands = list()
+    for high_suit in range(holdem_evaluator.NUM_SUITS):
+        for low_suit in range(holdem_evaluator.NUM_SUITS):
+            if high == low and low_suit <= high_suit:
+                continue
+            if high != low and suitedness and (high_suit == low_suit) != (suitedness == 's'):
+                continue
+            hands.append((high << 2 | high_suit, low << 2 | low_suit))
+    return hands
+
+
+def range_combos(hand_range: dict, deck, permutation: tuple = holdem_canonical.IDENTITY) -> list:
+    """
+        Get the hands of a range that the deck can still deal, relabelled
+        like the spot (see holdem_canonical.canonical_spot)
+    :param hand_range: The range (see parse_range)
+    :param deck: The integer cards left in the deck
+    :param permutation: The suit permutation applied to the spot
+    :return: The (hand, integer weight) of each hand, in the order of
+        holdem_utils.generate_pocket_cards over the deck (without the hands of
+        weight 0)
+    """
+    live_cards = frozenset(deck)
+    weights = dict()
+    for hand, weight in hand_range.items():
+        hand = frozenset(holdem_canonical.permute_cards(hand, permutation))
+        weight = round(weight * RANGE_WEIGHT_SCALE)
+        if weight and hand <= live_cards:
+            weights[hand] = weight
+    combos = [(hand, weights[frozenset(hand)]) for hand in combinations(deck, 2) if frozenset(hand) in weights]
+    if not combos:
+        raise ValueError('No hand of the range is left in the deck.')
+    return combos
+
+
+def range_stabilizer(combos: list, group: tuple) -> tuple:
+    """
+        Keep the suit permutations that map every hand of a range onto a hand
+        of the same weight
+    :param combos: The (hand, weight) of the range (see range_combos)
+    :param group: The suit permutations
+    :return: The permutations
+    """
+    weights = {frozenset(hand): weight for hand, weight in combos}
+    return tuple(permutation for permutation in group
+                 if all(weights.get(frozenset(holdem_canonical.permute_cards(hand, permutation))) == weight
+                        for hand, weight in combos))
@@ -0,0 +1,181 @@
+import random
+
+import holdem_utils
+
+from math import comb, floor, lcm, sqrt
+
+"""
+Variance-reduced sampling
+-------------------------
+Sampling strategies for the Monte Carlo simulations meant to reach a given
+accuracy with fewer boards than independent random boards (their results
+report the number of random boards they were worth, see effective_samples).
+
+The boards are drawn by generators taking the same arguments as the
+holdem_utils generators (deck, num_iterations, board_length, start, stop,
+seed), so every chunk of a request can draw its boards on its own, and each
+board they draw is still a uniform runout of the deck, so the results stay
+unbiased:
+
+- stratified: the first card of board j is deck[floor((j + u) * n / N)] for
+  a random offset u shared by the request (systematic sampling), so every
+  card of the deck starts the same share of the N boards; the other cards are
+  random
+- quasi_random: board j is the board of index floor(frac(u + j * a) * C) out
+  of the C runouts, a rank-1 lattice (a is the golden ratio) with a random
+  shift u shared by the request
+
+Both also stratify a single unknown hand: every possible hand is simulated
+(see holdem_calculator.unknown_simulation), and instead of num_sims boards
+each, the hands get boards in proportion to their weight and to the standard
+deviation of the player's equity against their starting hand class, as
+measured on the batches before (see neyman_allocation). Several unknown hands
+are only dealt at random (see holdem_calculator.multiway_simulation).
+
+Against random boards with num_sims boards per hand, heads-up preflop spots
+get about 1.2x the effective samples per board from the hand allocation,
+and 1.0-1.15x (stratified) and 1.1-1.35x (quasi_random) more from the boards
+of each hand at 50 boards per hand. Antithetic pairs of boards did not
+measurably help and were dropped.
+"""
+
+# Step of the quasi-random lattice
+GOLDEN_RATIO_CONJUGATE = (sqrt(5) - 1) / 2
+# Standard deviation of the player's equity assumed against the hand classes
+# with fewer than MIN_CLASS_DEALS deals so far (the one of all the deals, or
+# the largest an equity can have without any), and the smallest one a class
+# is given, so that a class whose first boards all ended alike still gets
+# some boards
+MIN_CLASS_DEALS = 32
+MAX_CLASS_DEVIATION = 0.5
+MIN_CLASS_DEVIATION = 0.1
+# The boards of each hand are a multiple (1 to MAX_BOARD_RATIO) of
+# num_sims / BOARD_UNITS boards, so that every batch of a request counts as
+# much, and the boards of the hands getting k units count
+# BOARD_WEIGHT_SCALE / k times
+BOARD_UNITS = 4
+MAX_BOARD_RATIO = 12
+BOARD_WEIGHT_SCALE = lcm(*range(1, MAX_BOARD_RATIO + 1))
+
+
+def _request_offset(seed) -> float:
+    # Random offset in [0, 1) shared by every chunk of a request, drawn from a
+    # stream that no chunk seed (seed + start, below 2 ** 64) reaches
+    return random.random() if seed is None else random.Random(seed | 1 << 64).random()
+
+
+# Draw the boards start..stop out of num_iterations, each one starting with
+# the card of its stratum
+def generate_stratified_boards(deck, num_iterations, board_length, start=0, stop=None, seed=None):
+    offset = _request_offset(seed)
+    rng = random.Random(None if seed is None else seed + start)
+    deck = list(deck)
+    num_cards = len(deck)
+    for index in range(start, num_iterations if stop is None else stop):
+        position = floor((index + offset) * num_cards / num_iterations)
+        first_card = deck[position]
+        deck[position] = deck[-1]
+        board = [first_card] + rng.sample(deck[:-1], 4 - board_length)
+        deck[position] = first_card
+        yield board
+
+
+# Draw the boards start..stop out of num_iterations from a randomly shifted
+# lattice over the runout indices
+def generate_quasi_random_boards(deck, num_iterations, board_length, start=0, stop=None, seed=None):
+    offset = _request_offset(seed)
+    num_runouts = comb(len(deck), 5 - board_length)
+    for index in range(start, num_iterations if stop is None else stop):
+        point = (offset + index * GOLDEN_RATIO_CONJUGATE) % 1
+        positions = unrank_combination(int(point * num_runouts), len(deck), 5 - board_length)
+        yield [deck[position] for position in positions]
+
+
+def unrank_combination(index: int, num_items: int, num_chosen: int) -> list:
+    """
+        Get a combination from its index in the order of itertools.combinations
+    :param index: The combination index (0..comb(num_items, num_chosen) - 1)
+    :param num_items: The number of items to choose from
+    :param num_chosen: The number of items chosen
+    :return: The positions of the chosen items
+    """
+    positions = list()
+    position = 0
+    while num_chosen:
+        # Number of combinations whose next item is at this position
+        num_combinations = comb(num_items - position - 1, num_chosen - 1)
+        if index < num_combinations:
+            positions.append(position)
+            num_chosen -= 1
+        else:
+            index -= num_combinations
+        position += 1
+    return positions
+
+
+def _deviation(equity_sum: float, square_sum: float, num_deals: int) -> float:
+    # Sample standard deviation of equities from their sums
+    mean = equity_sum / num_deals
+    variance = max(0.0, square_sum / num_deals - mean * mean) * num_deals / (num_deals - 1)
+    return max(MIN_CLASS_DEVIATION, sqrt(variance))
+
+
+def class_deviations(class_results) -> list:
+    """
+        Estimate the standard deviation of the player's equity (1 for a win,
+        1/2 for a split pot) against each class of the unknown hand
+    :param class_results: The sum of the equities, the sum of their squares and
+        the number of deals against each class
+    :return: The standard deviations
+    """
+    totals = [sum(results) for results in zip(*class_results)]
+    pooled = _deviation(*totals) if totals[2] >= MIN_CLASS_DEALS else MAX_CLASS_DEVIATION
+    return [_deviation(*results) if results[2] >= MIN_CLASS_DEALS else pooled for results in class_results]
+
+
+def neyman_allocation(strata, num_sims: int) -> list:
+    """
+        Share the boards of a simulation between the hands of the unknown hand
+        (Neyman allocation): the boards of each hand grow with its weight and
+        with the standard deviation of the player's equity against its class.
+        They come in units of boards (see BOARD_UNITS) and count inversely
+        often, so that every hand keeps its share of the results
+    :param strata: The number of hands, their weight and the standard deviation of
+        their class, for each class and hand weight
+    :param num_sims: The mean number of boards per hand
+    :return: The number of boards per hand and the weight of each board, for each stratum
+    """
+    num_boards = num_sims * sum(num_hands for num_hands, _, _ in strata)
+    total_score = sum(num_hands * weight * deviation for num_hands, weight, deviation in strata)
+    ideal_boards = [num_boards * weight * deviation / total_score for _, weight, deviation in strata]
+    unit = max(1, round(num_sims / BOARD_UNITS))
+    allocation = list()
+    for boards in ideal_boards:
+        ratio = min(MAX_BOARD_RATIO, max(1, round(boards / unit)))
+        allocation.append((ratio * unit, BOARD_WEIGHT_SCALE // ratio))
+    return allocation
+
+
+# Board generators by sampling strategy
+SAMPLING_STRATEGIES = {'random': holdem_utils.generate_random_boards,
+                       'stratified': generate_stratified_boards,
+                       'quasi_random': generate_quasi_random_boards}
+
+
+def effective_samples(batch_odds: list, standard_errors: list) -> float:
+    """
+        Get the number of independent random deals that would give the same
+        accuracy as some batches of simulations: the binomial variance of
+        each percentage over its squared standard error (the smallest such
+        number over the percentages)
+    :param batch_odds: The percentages of each batch (e.g. ties and each player's wins)
+    :param standard_errors: The standard error of the mean of each percentage
+    :return: The number of deals, or None if no percentage varies
+    """
+    num_batches = len(batch_odds)
+    samples = list()
+    for values, standard_error in zip(zip(*batch_odds), standard_errors):
+        mean = sum(values) / num_batches
+        if standard_error > 0:
+            samples.append(mean * (100 - mean) / standard_error ** 2)
+    return min(samples) if samples else None
@@ -0,0 +1,557 @@
+import mmap
+import os
+import sys
+
+import holdem_engine
+import holdem_evaluator
+import holdem_numpy
+import holdem_utils
+
+from array import array
+from functools import partial
+from itertools import combinations, permutations
+from math import comb
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""
+Precomputed tables
+------------------
+Exact results that never change are computed offline and shipped in the
+resources directory. Run this module to rebuild them:
+
+    python holdem_tables.py
+
+Starting hands are grouped in 169 classes, laid out as the usual 13x13 grid
+(ranks from ace to deuce): pairs on the diagonal, suited hands above it and
+offsuit hands below it, i.e. index = row * 13 + column.
+
+Preflop vs random hand (preflop_vs_random.bin): one record per class of 23
+unsigned 64-bit little-endian counters, for a single hand of the class against
+every opponent hand and every board:
+    win, tie, lose, player histogram (10), opponent histogram (10)
+The histograms are indexed as holdem_utils.HAND_RANKINGS.
+
+Preflop hand vs hand (preflop_matchups.bin): one record per matchup of two
+known hands of 12 unsigned 32-bit little-endian counters, for the first hand
+against the second over every board:
+    win, tie, first hand histogram (10)
+Matchups are laid out as the 169x169 grid of their classes, each cell holding
+one record per suit configuration (see MATCHUP_VARIANTS and matchup_slot), so
+looking one up takes a couple of dictionary lookups. The table is memory
+mapped rather than read. Building it requires NumPy.
+"""
+
+TABLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+PREFLOP_TABLE_PATH = os.path.join(TABLES_DIR, 'preflop_vs_random.bin')
+PREFLOP_TABLE_MAGIC = b'HOPR0001'
+
+NUM_CLASSES = 169
+NUM_POKER_HANDS = len(holdem_utils.HAND_RANKINGS)
+PREFLOP_RECORD_SIZE = 3 + 2 * NUM_POKER_HANDS
+
+MATCHUP_TABLE_PATH = os.path.join(TABLES_DIR, 'preflop_matchups.bin')
+MATCHUP_TABLE_MAGIC = b'HOHH0001'
+MATCHUP_RECORD_SIZE = 2 + NUM_POKER_HANDS
+# Suits of the second hand's cards (highest first), numbered in order of
+# appearance after the first hand's (0 is the suit of the first hand's highest
+# card), keyed by whether each hand is suited
+MATCHUP_VARIANTS = {
+    (True, True): ((0, 0), (1, 1)),
+    (True, False): ((0, 1), (1, 0), (1, 2)),
+    (False, True): ((0, 0), (1, 1), (2, 2)),
+    (False, False): ((0, 1), (0, 2), (1, 0), (1, 2), (2, 0), (2, 1), (2, 3)),
+}
+NUM_HOLDINGS = comb(holdem_evaluator.DECK_SIZE, 2)
+# Boards ranked at once per matchup table worker (at most 255, the boards are
+# counted in bytes)
+MATCHUP_BLOCK_SIZE = 255
+# Strength given to the holdings that share a card with the board, above any
+# real strength
+_DEAD_STRENGTH = 1 << 30
+
+
+def hand_class(first_card: int, second_card: int) -> int:
+    """
+        Get the starting hand class of two integer cards
+    :param first_card: The first card
+    :param second_card: The second card
+    :return: The class index (0..168)
+    """
+    high_row, low_row = 12 - max(first_card, second_card) // 4, 12 - min(first_card, second_card) // 4
+    if first_card & 3 == second_card & 3:
+        return high_row * 13 + low_row
+    return low_row * 13 + high_row
+
+
+def hand_class_name(class_index: int) -> str:
+    """
+        Get the usual name of a starting hand class, e.g. "AKs", "T9o", "77"
+    :param class_index: The class index
+    :return: The class name
+    """
+    row, column = divmod(class_index, 13)
+    if row == column:
+        return holdem_utils.NAME_STRING[row] * 2
+    if row < column:
+        return holdem_utils.NAME_STRING[row] + holdem_utils.NAME_STRING[column] + 's'
+    return holdem_utils.NAME_STRING[column] + holdem_utils.NAME_STRING[row] + 'o'
+
+
+def class_combos(class_index: int) -> int:
+    """
+        Get the number of two-card combinations of a starting hand class
+    :param class_index: The class index
+    :return: 6 for pairs, 4 for suited and 12 for offsuit hands
+    """
+    row, column = divmod(class_index, 13)
+    return 6 if row == column else 4 if row < column else 12
+
+
+def canonical_boards(num_cards: int = 5) -> dict:
+    """
+        Enumerate the boards that are distinct up to a permutation of the suits
+    :param num_cards: The number of board cards
+    :return: The weight (number of equivalent boards) of a representative of
+        each class, keyed by the representative's integer cards
+    """
+    boards = dict()
+    for board in combinations(range(holdem_evaluator.DECK_SIZE), num_cards):
+        suit_masks = [0] * holdem_evaluator.NUM_SUITS
+        for card in board:
+            suit_masks[card & 3] |= 1 << (card >> 2)
+        suit_masks.sort(reverse=True)
+        boards[tuple(suit_masks)] = boards.get(tuple(suit_masks), 0) + 1
+    # Relabel the suits in order of their rank masks
+    representatives = dict()
+    for suit_masks, weight in boards.items():
+        board = tuple(rank << 2 | suit for suit, mask in enumerate(suit_masks)
+                      for rank in range(holdem_evaluator.NUM_RANKS) if mask >> rank & 1)
+        representatives[board] = weight
+    return representatives
+
+
+def _preflop_board_counts(board, weight, class_of, class_totals):
+    """
+        Add the results of every holding on one board to the class totals:
+        win, tie and lose counts against every other holding and the
+        category the holding makes, each multiplied by the board weight
+    """
+    remaining = [card for card in range(holdem_evaluator.DECK_SIZE) if card not in board]
+    holdings = list(combinations(remaining, 2))
+    strengths = holdem_evaluator.evaluate_hands(holdings, board)
+    num_holdings = len(holdings)
+    num_opponents = comb(len(remaining) - 2, 2)
+
+    # Number of holdings with a lower and an equal strength, overall and
+    # among the holdings that share a card with each holding
+    order = sorted(range(num_holdings), key=strengths.__getitem__)
+    lower, equal = [0] * num_holdings, [0] * num_holdings
+    lower_shared, equal_shared = [0] * num_holdings, [0] * num_holdings
+    by_card = dict((card, list()) for card in remaining)
+    _count_lower_equal(order, strengths, lower, equal)
+    for index in order:
+        first_card, second_card = holdings[index]
+        by_card[first_card].append(index)
+        by_card[second_card].append(index)
+    for card_order in by_card.values():
+        _count_lower_equal(card_order, strengths, lower_shared, equal_shared)
+
+    # A holding shares both its cards only with itself, which is never lower
+    # and always equal
+    for index in range(num_holdings):
+        wins = lower[index] - lower_shared[index]
+        ties = equal[index] - equal_shared[index] + 1
+        totals = class_totals[class_of[holdings[index]]]
+        totals[0] += weight * wins
+        totals[1] += weight * ties
+        totals[2] += weight * (num_opponents - wins - ties)
+        totals[3 + holdem_evaluator.hand_category(strengths[index])] += weight
+
+
+def _count_lower_equal(order, strengths, lower, equal):
+    # Walk holdings sorted by strength and add, for each, the number of
+    # holdings before it with a lower strength and the size of its tie group
+    start = 0
+    while start < len(order):
+        strength, stop = strengths[order[start]], start + 1
+        while stop < len(order) and strengths[order[stop]] == strength:
+            stop += 1
+        for position in range(start, stop):
+            lower[order[position]] += start
+            equal[order[position]] += stop - start
+        start = stop
+
+
+def _preflop_boards_task(boards, board_range):
+    """
+        Worker task: preflop counts of the boards start..stop
+    :return: The packed class totals (win, tie, lose, category histogram)
+    """
+    class_of = dict(((first_card, second_card), hand_class(first_card, second_card))
+                    for first_card, second_card in combinations(range(holdem_evaluator.DECK_SIZE), 2))
+    class_totals = [[0] * (3 + NUM_POKER_HANDS) for _ in range(NUM_CLASSES)]
+    for board, weight in boards[board_range[0]:board_range[1]]:
+        _preflop_board_counts(board, weight, class_of, class_totals)
+    packed = array('Q')
+    for totals in class_totals:
+        packed.extend(totals)
+    return packed
+
+
+def build_preflop_table(path: str = PREFLOP_TABLE_PATH, engine: holdem_engine.HoldemEngine = None):
+    """
+        Compute the exact preflop results of every starting hand class against
+        a random hand, by enumerating every opponent hand and every board, and
+        write them to path
+    :param path: The table file
+    :param engine: The engine running the computation (defaults to the shared engine)
+    """
+    if engine is None:
+        engine = holdem_engine.get_default_engine()
+    boards = list(canonical_boards().items())
+    task = partial(_preflop_boards_task, boards)
+    record_size = 3 + NUM_POKER_HANDS
+    class_totals = [0] * (NUM_CLASSES * record_size)
+    for packed in engine.map(task, holdem_engine.split_range(len(boards), engine.num_chunks)):
+        for index, count in enumerate(packed):
+            class_totals[index] += count
+
+    # Results of a single hand of each class (every hand of a class is
+    # equivalent up to a permutation of the suits)
+    records = list()
+    for class_index in range(NUM_CLASSES):
+        totals = class_totals[class_index * record_size:(class_index + 1) * record_size]
+        records.append([_exact_division(total, class_combos(class_index)) for total in totals])
+
+    # Number of 7-card hands of each category: overall, containing a given
+    # card, and containing two given cards (the player histogram over boards)
+    all_hands, card_hands = [0] * NUM_POKER_HANDS, dict()
+    for first_card, second_card in combinations(range(holdem_evaluator.DECK_SIZE), 2):
+        histogram = records[hand_class(first_card, second_card)][3:]
+        for card in (first_card, second_card):
+            card_totals = card_hands.setdefault(card, [0] * NUM_POKER_HANDS)
+            for category, count in enumerate(histogram):
+                card_totals[category] += count
+    for category in range(NUM_POKER_HANDS):
+        all_hands[category] = _exact_division(sum(card_hands[card][category] for card in card_hands), 7 * 6)
+        for card in card_hands:
+            card_hands[card][category] = _exact_division(card_hands[card][category], 6)
+
+    # Each board is counted once per opponent hand that avoids it and each
+    # opponent 7-card hand once per way of splitting it in board and hand
+    num_opponents = comb(holdem_evaluator.DECK_SIZE - 7, 2)
+    table = array('Q')
+    for class_index, record in enumerate(records):
+        first_card, second_card = _class_representative(class_index)
+        player_histogram = [num_opponents * count for count in record[3:]]
+        opponent_histogram = [21 * (all_hands[category] - card_hands[first_card][category] -
+                                    card_hands[second_card][category] + record[3 + category])
+                              for category in range(NUM_POKER_HANDS)]
+        table.extend(record[:3] + player_histogram + opponent_histogram)
+    _write_table(path, PREFLOP_TABLE_MAGIC, table)
+
+
+def _matchup_boards_task(boards, board_range):
+    """
+        Worker task: matchup counts of the boards start..stop, for every
+        ordered pair of holdings (sharing cards or not)
+    :return: The number of boards on which the first holding is stronger and the
+        histogram of the first holding over the boards both holdings avoid
+        (hand category, first holding, second holding), each board counting
+        its weight times
+    """
+    holdings = numpy.array(list(combinations(range(holdem_evaluator.DECK_SIZE), 2)))
+    wins = numpy.zeros((NUM_HOLDINGS, NUM_HOLDINGS), dtype=numpy.int64)
+    histograms = numpy.zeros((NUM_POKER_HANDS * NUM_HOLDINGS, NUM_HOLDINGS))
+    greater = numpy.empty((NUM_HOLDINGS, NUM_HOLDINGS), dtype=bool)
+    for block_start in range(board_range[0], board_range[1], MATCHUP_BLOCK_SIZE):
+        block = boards[block_start:min(block_start + MATCHUP_BLOCK_SIZE, board_range[1])]
+        weights = numpy.array([weight for _, weight in block], dtype=numpy.float64)
+        live = numpy.empty((len(block), NUM_HOLDINGS), dtype=bool)
+        strengths = numpy.full((len(block), NUM_HOLDINGS), _DEAD_STRENGTH, dtype=numpy.int32)
+        for row, (board, _) in enumerate(block):
+            live[row] = ~numpy.isin(holdings, board).any(axis=1)
+            board_cards = numpy.broadcast_to(numpy.array(board), (int(live[row].sum()), len(board)))
+            strengths[row, live[row]] = holdem_numpy.evaluate(numpy.hstack((holdings[live[row]], board_cards)))
+
+        # A dead holding is stronger than every live one: the extra wins are
+        # taken out once the boards are all counted (see build_matchup_table)
+        board_counts = dict()
+        for row_strengths, weight in zip(strengths, weights):
+            numpy.greater(row_strengths[:, None], row_strengths[None, :], out=greater)
+            board_counts.setdefault(weight, numpy.zeros((NUM_HOLDINGS, NUM_HOLDINGS), dtype=numpy.uint8))
+            board_counts[weight] += greater
+        for weight, counts in board_counts.items():
+            wins += int(weight) * counts.astype(numpy.int64)
+
+        # The histograms are the products of the weighted category of each
+        # live holding and the liveness of each holding, summed over boards
+        categories = numpy.zeros((len(block), NUM_POKER_HANDS, NUM_HOLDINGS))
+        rows, columns = numpy.nonzero(live)
+        categories[rows, strengths[rows, columns] >> holdem_evaluator.CATEGORY_SHIFT, columns] = weights[rows]
+        histograms += categories.reshape(len(block), -1).T @ live.astype(numpy.float64)
+    return wins, numpy.rint(histograms).astype(numpy.int64).reshape(NUM_POKER_HANDS, NUM_HOLDINGS, NUM_HOLDINGS)
+
+
+def _matchup_classes(holdings: list) -> tuple:
+    """
+        Number the ordered pairs of holdings that are the same up to a
+        permutation of the suits
+    :param holdings: The holdings, in combinations order
+    :return: The class of each pair (holdings x holdings array, -1 for the
+        pairs sharing a card) and the number of classes
+    """
+    holding_index = numpy.zeros((holdem_evaluator.DECK_SIZE, holdem_evaluator.DECK_SIZE), dtype=numpy.int64)
+    for index, (first_card, second_card) in enumerate(holdings):
+        holding_index[first_card, second_card] = holding_index[second_card, first_card] = index
+    cards = numpy.array(holdings)
+    first_cards, second_cards = cards[:, None, :], cards[None, :, :]
+    keys = None
+    for permutation in permutations(range(holdem_evaluator.NUM_SUITS)):
+        card_map = numpy.array([card & ~3 | permutation[card & 3] for card in range(holdem_evaluator.DECK_SIZE)])
+        first = holding_index[card_map[first_cards[..., 0]], card_map[first_cards[..., 1]]]
+        second = holding_index[card_map[second_cards[..., 0]], card_map[second_cards[..., 1]]]
+        permuted_keys = first * NUM_HOLDINGS + second
+        keys = permuted_keys if keys is None else numpy.minimum(keys, permuted_keys)
+    shared = (cards[:, None, :, None] == cards[None, :, None, :]).any(axis=(2, 3))
+    classes = numpy.full(keys.shape, -1, dtype=numpy.int64)
+    unique_keys, classes[~shared] = numpy.unique(keys[~shared], return_inverse=True)
+    return classes, len(unique_keys)
+
+
+def _class_average(counts, classes, num_classes: int):
+    # Average counts over the pairs of each class (sums over the classes of
+    # representative boards, see build_preflop_table)
+    live = classes >= 0
+    sizes = numpy.bincount(classes[live], minlength=num_classes)
+    totals = numpy.bincount(classes[live], counts[live].astype(numpy.float64), minlength=num_classes)
+    averages = numpy.rint(totals / sizes).astype(numpy.int64)
+    if (averages * sizes != numpy.rint(totals).astype(numpy.int64)).any():
+        raise ArithmeticError('Table counts are not symmetric.')
+    return averages
+
+
+def build_matchup_table(path: str = MATCHUP_TABLE_PATH, engine: holdem_engine.HoldemEngine = None):
+    """
+        Compute the exact preflop results of every matchup of two known hands,
+        by ranking every holding on every board, and write them to path
+    :param path: The table file
+    :param engine: The engine running the computation (defaults to the shared engine)
+    """
+    if numpy is None:
+        raise RuntimeError('Building the matchup table requires NumPy.')
+    if engine is None:
+        engine = holdem_engine.get_default_engine()
+    boards = list(canonical_boards().items())
+    task = partial(_matchup_boards_task, boards)
+    wins, histograms = None, None
+    for task_wins, task_histograms in engine.imap_unordered(task, holdem_engine.split_range(len(boards),
+                                                                                            engine.num_chunks)):
+        if wins is None:
+            wins, histograms = task_wins, task_histograms
+        else:
+            wins += task_wins
+            histograms += task_histograms
+
+    # Every pair of a class has the same results over all boards: the sum
+    # over the class of its results on the representative boards, divided by
+    # the class size (see build_preflop_table)
+    holdings = list(combinations(range(holdem_evaluator.DECK_SIZE), 2))
+    classes, num_classes = _matchup_classes(holdings)
+    # The dead first holdings counted as wins: the boards that avoid the second
+    # holding but not the first
+    dead_wins = comb(holdem_evaluator.DECK_SIZE - 2, 5) - comb(holdem_evaluator.DECK_SIZE - 4, 5)
+    class_wins = _class_average(wins, classes, num_classes) - dead_wins
+    class_histograms = [_class_average(histogram, classes, num_classes) for histogram in histograms]
+    num_boards = comb(holdem_evaluator.DECK_SIZE - 4, 5)
+
+    table = array('I', bytes(4 * MATCHUP_RECORD_SIZE * _matchup_offsets()[-1]))
+    for first_index, first_hand in enumerate(holdings):
+        for second_index, second_hand in enumerate(holdings):
+            class_index = classes[first_index, second_index]
+            if class_index < 0:
+                continue
+            start = matchup_slot(first_hand, second_hand) * MATCHUP_RECORD_SIZE
+            first_wins = class_wins[class_index]
+            second_wins = class_wins[classes[second_index, first_index]]
+            table[start] = first_wins
+            table[start + 1] = num_boards - first_wins - second_wins
+            for category, class_histogram in enumerate(class_histograms):
+                table[start + 2 + category] = class_histogram[class_index]
+    _write_table(path, MATCHUP_TABLE_MAGIC, table)
+
+
+def _class_representative(class_index: int) -> tuple:
+    # Spades and clubs (and hearts for a pair's second card)
+    row, column = divmod(class_index, 13)
+    high_rank, low_rank = 12 - min(row, column), 12 - max(row, column)
+    if row < column:
+        return high_rank << 2, low_rank << 2
+    return high_rank << 2, low_rank << 2 | 1
+
+
+def _exact_division(dividend: int, divisor: int) -> int:
+    quotient, remainder = divmod(dividend, divisor)
+    if remainder:
+        raise ArithmeticError('Table counts are not symmetric.')
+    return quotient
+
+
+def _write_table(path: str, magic: bytes, table: array):
+    if sys.byteorder != 'little':
+        table.byteswap()
+    with open(path, 'wb') as table_file:
+        table_file.write(magic)
+        table_file.write(table.tobytes())
+
+
+def _read_table(path: str, magic: bytes) -> array:
+    with open(path, 'rb') as table_file:
+        if table_file.read(len(magic)) != magic:
+            raise ValueError('{} is not a valid table.'.format(path))
+        table = array('Q')
+        table.frombytes(table_file.read())
+    if sys.byteorder != 'little':
+        table.byteswap()
+    return table
+
+
+_preflop_table = None
+_matchup_offsets_table = None
+_matchup_table = None
+
+
+def load_preflop_table() -> array:
+    """
+        Get the preflop vs random hand table (loaded on first use)
+    :return: The table records, flattened
+    """
+    global _preflop_table
+    if _preflop_table is None:
+        table = _read_table(PREFLOP_TABLE_PATH, PREFLOP_TABLE_MAGIC)
+        if len(table) != NUM_CLASSES * PREFLOP_RECORD_SIZE:
+            raise ValueError('{} is not a valid table.'.format(PREFLOP_TABLE_PATH))
+        _preflop_table = table
+    return _preflop_table
+
+
+def lookup_preflop(pocket_cards) -> tuple:
+    """
+        Get the exact results of a known hand against a random hand, if the
+        table is available
+    :param pocket_cards: The two players' hands (as parsed by holdem_argparser),
+        one of them (None, None)
+    :return: The number of times each player won (see holdem_utils.new_winner_list) and the
+        hand histogram of each player, or None
+    """
+    if len(pocket_cards) != 2 or pocket_cards.count((None, None)) != 1:
+        return None
+    if not os.path.exists(PREFLOP_TABLE_PATH):
+        return None
+    unknown_index = pocket_cards.index((None, None))
+    first_card, second_card = holdem_evaluator.encode_cards(pocket_cards[1 - unknown_index])
+    start = hand_class(first_card, second_card) * PREFLOP_RECORD_SIZE
+    record = load_preflop_table()[start:start + PREFLOP_RECORD_SIZE]
+    win, tie, lose = record[:3]
+    player_histogram = list(record[3:3 + NUM_POKER_HANDS])
+    opponent_histogram = list(record[3 + NUM_POKER_HANDS:])
+    if unknown_index:
+        return [tie, win, lose, tie, tie], [player_histogram, opponent_histogram]
+    return [tie, lose, win, tie, tie], [opponent_histogram, player_histogram]
+
+
+def _matchup_offsets() -> array:
+    # The first record of each pair of classes (and the number of records last)
+    global _matchup_offsets_table
+    if _matchup_offsets_table is None:
+        offsets = array('L', [0])
+        for first_class in range(NUM_CLASSES):
+            for second_class in range(NUM_CLASSES):
+                variants = MATCHUP_VARIANTS[_suited_class(first_class), _suited_class(second_class)]
+                offsets.append(offsets[-1] + len(variants))
+        _matchup_offsets_table = offsets
+    return _matchup_offsets_table
+
+
+def _suited_class(class_index: int) -> bool:
+    row, column = divmod(class_index, 13)
+    return row < column
+
+
+def matchup_slot(first_hand, second_hand) -> int:
+    """
+        Get the record of a matchup in the matchup table
+    :param first_hand: The first hand's integer cards
+    :param second_hand: The second hand's integer cards
+    :return: The record index
+    """
+    first_hand, second_hand = sorted(first_hand, reverse=True), sorted(second_hand, reverse=True)
+    suit_labels = dict()
+    for card in first_hand + second_hand:
+        suit_labels.setdefault(card & 3, len(suit_labels))
+    variants = MATCHUP_VARIANTS[first_hand[0] & 3 == first_hand[1] & 3, second_hand[0] & 3 == second_hand[1] & 3]
+    variant = variants.index((suit_labels[second_hand[0] & 3], suit_labels[second_hand[1] & 3]))
+    return _matchup_offsets()[hand_class(*first_hand) * NUM_CLASSES + hand_class(*second_hand)] + variant
+
+
+def load_matchup_table():
+    """
+        Get the preflop hand vs hand table (memory mapped on first use)
+    :return: The table records, flattened (a sequence of unsigned 32-bit integers)
+    """
+    global _matchup_table
+    if _matchup_table is None:
+        with open(MATCHUP_TABLE_PATH, 'rb') as table_file:
+            mapped = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(MATCHUP_TABLE_MAGIC)] != MATCHUP_TABLE_MAGIC:
+            raise ValueError('{} is not a valid table.'.format(MATCHUP_TABLE_PATH))
+        if sys.byteorder == 'little':
+            table = memoryview(mapped)[len(MATCHUP_TABLE_MAGIC):].cast('I')
+        else:
+            table = array('I', mapped[len(MATCHUP_TABLE_MAGIC):])
+            table.byteswap()
+        if len(table) != _matchup_offsets()[-1] * MATCHUP_RECORD_SIZE:
+            raise ValueError('{} is not a valid table.'.format(MATCHUP_TABLE_PATH))
+        _matchup_table = table
+    return _matchup_table
+
+
+def lookup_matchup(pocket_cards) -> tuple:
+    """
+        Get the exact results of two known hands against each other, if the
+        table is available
+    :param pocket_cards: The two players' hands (as parsed by holdem_argparser)
+    :return: The number of times each player won (see holdem_utils.new_winner_list) and the
+        hand histogram of each player, or None
+    """
+    if len(pocket_cards) != 2 or (None, None) in pocket_cards:
+        return None
+    if not os.path.exists(MATCHUP_TABLE_PATH):
+        return None
+    first_hand, second_hand = (holdem_evaluator.encode_cards(hand) for hand in pocket_cards)
+    table = load_matchup_table()
+    first_start = matchup_slot(first_hand, second_hand) * MATCHUP_RECORD_SIZE
+    second_start = matchup_slot(second_hand, first_hand) * MATCHUP_RECORD_SIZE
+    tie = table[first_start + 1]
+    winner_list = [tie, table[first_start], table[second_start], tie, tie]
+    return winner_list, [list(table[first_start + 2:first_start + MATCHUP_RECORD_SIZE]),
+                         list(table[second_start + 2:second_start + MATCHUP_RECORD_SIZE])]
+
+
+def lookup_spot(pocket_cards) -> tuple:
+    """
+        Get the exact results of a preflop spot from the tables that cover it
+    :param pocket_cards: The players' hands (as parsed by holdem_argparser)
+    :return: The number of times each player won (see holdem_utils.new_winner_list) and the
+        hand histogram of each player, or None
+    """
+    return lookup_preflop(pocket_cards) or lookup_matchup(pocket_cards)
+
+
+if __name__ == '__main__':
+    build_preflop_table()
+    build_matchup_table()
@@ -1,4 +1,6 @@
-from itertools import combinations
+import threading
+
+from itertools import chain, combinations
 
 # Constants
 SUIT_INDEX = {'s': 0,
@@ -30,11 +32,33 @@ for num in range(2, 10):
 
 
 class Card:
-    # Takes in strings of the format: "As", "Tc", "6d"
-    def __init__(self, card_string):
-        value, self.suit = card_string[0], card_string[1]
-        self.value = SUIT_VALUES[value]
-        self.suit_index = SUIT_INDEX[self.suit]
+    # Takes in strings of the format: "As", "Tc", "6d". Cards are interned
+    # and immutable: Card('As') is Card('As'), so cards compare and hash by
+    # identity. index is the card's integer form (see holdem_evaluator) and
+    # its bit in deck masks
+    __slots__ = ('value', 'suit', 'suit_index', 'index')
+    _cards = dict()
+
+    def __new__(cls, card_string):
+        card = cls._cards.get(card_string)
+        if card is None:
+            value, suit = card_string[0], card_string[1]
+            card = object.__new__(cls)
+            object.__setattr__(card, 'value', SUIT_VALUES[value])
+            object.__setattr__(card, 'suit', suit)
+            object.__setattr__(card, 'suit_index', SUIT_INDEX[suit])
+            object.__setattr__(card, 'index', (card.value - 2) << 2 | card.suit_index)
+            # Strings with trailing characters map to the same card
+            card = cls._cards.setdefault(value + suit, card)
+            cls._cards[card_string] = card
+        return card
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Cards are immutable.')
+
+    def __reduce__(self):
+        # Unpickled cards are the interned ones of the receiving process
+        return Card, (str(self),)
 
     def __str__(self):
         return NAME_STRING[14 - self.value] + self.suit
@@ -42,30 +66,25 @@ class Card:
     def __repr__(self):
         return NAME_STRING[14 - self.value] + self.suit
 
-    def __eq__(self, other):
-        if self is None:
-            return other is None
-        elif other is None:
-            return False
-        return self.value == other.value and self.suit == other.suit
+
+# Every card, in deck order
+DECK = tuple(Card(value + suit) for suit in REVERSE_SUIT_INDEX for value in NAME_STRING)
+
+
+# Returns the bitmask of the given cards (bit card.index set for each card)
+def card_mask(cards):
+    mask = 0
+    for card in cards:
+        mask |= 1 << card.index
+    return mask
 
 
 # Returns deck of cards with all hand cards and board cards removed
 def generate_deck(pocket_cards, board):
-    deck = list()
-    for suit in REVERSE_SUIT_INDEX:
-        for value in NAME_STRING:
-            deck.append(Card(value + suit))
-    taken_cards = list()
-    for hand_card in pocket_cards:
-        for card in hand_card:
-            if card is not None:
-                taken_cards.append(card)
-    if board and len(board) > 0:
-        taken_cards.extend(board)
-    for taken_card in taken_cards:
-        deck.remove(taken_card)
-    return tuple(deck)
+    taken_mask = card_mask(card for hand_card in pocket_cards for card in hand_card if card is not None)
+    if board:
+        taken_mask |= card_mask(board)
+    return tuple(card for card in DECK if not taken_mask >> card.index & 1)
 
 
 # Generate all possible hand card combinations
@@ -73,19 +92,30 @@ def generate_pocket_cards(deck):
     return combinations(deck, 2)
 
 
-# Generate num_iterations random boards
-def generate_random_boards(deck, num_iterations, board_length):
+# Generate num_iterations random boards. Workers can generate the boards
+# start..stop of a request on their own: each such chunk is drawn from a
+# stream seeded with seed + start
+def generate_random_boards(deck, num_iterations, board_length, start=0, stop=None, seed=None):
     import random
     import time
-    random.seed(time.time())
-    for _ in range(num_iterations):
-        yield random.sample(deck, 5 - board_length)
+    rng = random.Random(time.time() if seed is None else seed + start)
+    for _ in range(start, num_iterations if stop is None else stop):
+        yield rng.sample(deck, 5 - board_length)
 
 
-# Generate all possible boards
-def generate_exhaustive_boards(deck, num_iterations, board_length):
+# Generate all possible boards (or only the boards start..stop of the
+# enumeration; seed is unused)
+def generate_exhaustive_boards(deck, num_iterations, board_length, start=0, stop=None, seed=None):
     import itertools
-    return itertools.combinations(deck, 5 - board_length)
+    return itertools.islice(itertools.combinations(deck, 5 - board_length), start, stop)
+
+
+# Returns the number of boards a board generator yields
+def count_boards(generate_boards, deck, num_iterations, board_length):
+    if generate_boards is generate_exhaustive_boards:
+        from math import comb
+        return comb(len(deck), 5 - board_length)
+    return num_iterations
 
 
 # Returns a board of cards all with suit = flush_index
@@ -95,9 +125,20 @@ def generate_suit_board(flat_board, flush_index):
     return histogram
 
 
+# (value of card, frequency of card) tuples of preprocess, built once and
+# indexed by histogram index then frequency
+VALUE_FREQUENCIES = tuple(tuple((14 - index, frequency) for frequency in range(8)) for index in range(13))
+
+
 # Returns a list of two tuples of the form: (value of card, frequency of card)
 def preprocess(histogram):
-    return [(14 - index, frequency) for index, frequency in enumerate(histogram) if frequency]
+    histogram_board = list()
+    value_frequencies = 0
+    for frequency in histogram:
+        if frequency:
+            histogram_board.append(VALUE_FREQUENCIES[value_frequencies][frequency])
+        value_frequencies += 1
+    return histogram_board
 
 
 # Takes an iterable sequence and returns two items in a tuple:
@@ -105,14 +146,19 @@ def preprocess(histogram):
 # 2: 13-long list showing how often each card value appears in the sequence
 def preprocess_board(flat_board):
     suit_histogram, histogram = [0] * 4, [0] * 13
-    # Reversing the order in histogram so in the future, we can traverse
-    # starting from index 0
-    for card in flat_board:
-        histogram[14 - card.value] += 1
-        suit_histogram[card.suit_index] += 1
+    count_cards(flat_board, suit_histogram, histogram)
     return suit_histogram, histogram, max(suit_histogram)
 
 
+# Adds count (1 or -1 to take them out) to the suit and value histograms for
+# each card of the sequence. Reversing the order in histogram so in the
+# future, we can traverse starting from index 0
+def count_cards(flat_board, suit_histogram, histogram, count=1):
+    for card in flat_board:
+        histogram[14 - card.value] += count
+        suit_histogram[card.suit_index] += count
+
+
 # Returns tuple: (Is there a straight flush?, high card)
 def detect_straight_flush(suit_board):
     contiguous_length, fail_index = 1, len(suit_board) - 5
@@ -173,10 +219,11 @@ def detect_three_of_a_kind_kickers(histogram_board):
                 return kicker1, elem[0]
 
 
-# Returns the highest kicker available
-def detect_highest_kicker(histogram_board):
+# Returns the highest kicker left beside the two given pairs (a third pair
+# outranks any single card below it)
+def detect_two_pair_kicker(histogram_board, high_pair, low_pair):
     for elem in histogram_board:
-        if elem[1] == 1:
+        if elem[0] != high_pair and elem[0] != low_pair:
             return elem[0]
 
 
@@ -220,19 +267,19 @@ def detect_hand(pocket_cards, given_board, suit_histogram,
             if hand_card.suit_index == flush_index:
                 max_suit += 1
         if max_suit >= 5:
-            flat_board = list(given_board)
-            flat_board.extend(pocket_cards)
-            suit_board = generate_suit_board(flat_board, flush_index)
+            suit_board = generate_suit_board(chain(given_board, pocket_cards), flush_index)
             result = detect_straight_flush(suit_board)
             if result[0]:
                 return (8, result[1]) if result[1] != 14 else (9,)
             return 5, get_high_cards(suit_board)
 
-    # Add hande cards to histogram data structure and process it
-    full_histogram = full_histogram[:]
+    # Add hand cards to the board histogram (shared by every hand on the
+    # board, so they are taken out again) and process it
     for hand_card in pocket_cards:
         full_histogram[14 - hand_card.value] += 1
     histogram_board = preprocess(full_histogram)
+    for hand_card in pocket_cards:
+        full_histogram[14 - hand_card.value] -= 1
 
     # Find which card value shows up the most and second most times
     current_max, max_val, second_max, second_max_val = 0, 0, 0, 0
@@ -261,8 +308,8 @@ def detect_hand(pocket_cards, given_board, suit_histogram,
     if current_max == 2:
         # Check to see if there is a two pair
         if second_max == 2:
-            return 2, max_val, second_max_val, detect_highest_kicker(
-                histogram_board)
+            return 2, max_val, second_max_val, detect_two_pair_kicker(
+                histogram_board, max_val, second_max_val)
         # Return pair
         else:
             return 1, max_val, detect_pair_kickers(histogram_board)
@@ -270,18 +317,93 @@ def detect_hand(pocket_cards, given_board, suit_histogram,
     return 0, get_high_cards(histogram_board)
 
 
-# Returns the index of the player with the winning hand
+# Empty suit and value histograms of each thread, filled with the board by
+# evaluate_hands and emptied again instead of built for every board
+_histograms = threading.local()
+
+
+# Returns the detect_hand result of every player on a complete board. The
+# results are written to result_list (one item per player) if given, so that
+# loops over many boards reuse it
+def evaluate_hands(pocket_cards, board, result_list=None):
+    histograms = getattr(_histograms, 'empty', None)
+    if histograms is None:
+        histograms = _histograms.empty = ([0] * 4, [0] * 13)
+    suit_histogram, histogram = histograms
+    if result_list is None:
+        result_list = [None] * len(pocket_cards)
+    count_cards(board, suit_histogram, histogram)
+    try:
+        max_suit = max(suit_histogram)
+        index = 0
+        for hand_card in pocket_cards:
+            result_list[index] = detect_hand(hand_card, board, suit_histogram, histogram, max_suit)
+            index += 1
+    finally:
+        count_cards(board, suit_histogram, histogram, -1)
+    return result_list
+
+
+# Returns the index in HAND_RANKINGS of a detect_hand result
+def hand_category(result):
+    return result[0]
+
+
+# Returns the index of the player with the winning hand (0 if the pot is split)
 def compare_hands(result_list):
     best_hand = max(result_list)
-    winning_player_index = result_list.index(best_hand) + 1
     # Check for ties
-    if best_hand in result_list[winning_player_index:]:
+    if result_list.count(best_hand) > 1:
         return 0
-    return winning_player_index
+    return result_list.index(best_hand) + 1
+
 
+# Creates an empty winner_list for num_players players. Its layout is:
+# index 0 counts the split pots, index i + 1 the wins of player i and index
+# num_players + 1 + i the split pots player i shares (has the best hand in)
+def new_winner_list(num_players):
+    return [0] * (2 * num_players + 1)
 
-# Print results
-def parse_result(pocket_cards, winner_list, result_histograms):
+
+# Returns the number of deals counted in a winner_list (each one a win or a
+# split pot)
+def count_deals(winner_list):
+    return sum(winner_list[:len(winner_list) // 2 + 1])
+
+
+# Counts weight deals whose pot goes to the given players in winner_list: a
+# win if there is only one of them, else a split pot they share
+def count_pot(winner_list, pot_winners, num_players, weight=1):
+    if len(pot_winners) == 1:
+        winner_list[pot_winners[0] + 1] += weight
+        return
+    winner_list[0] += weight
+    for index in pot_winners:
+        winner_list[num_players + 1 + index] += weight
+
+
+# Counts a deal in winner_list, each deal counting weight times
+def count_winner(result_list, winner_list, weight=1):
+    winner_index = compare_hands(result_list)
+    if winner_index:
+        winner_list[winner_index] += weight
+        return
+    # Only the players with the best hand share the pot (counted in place
+    # rather than listed for count_pot)
+    best_hand = max(result_list)
+    winner_list[0] += weight
+    tie_index = len(result_list) + 1
+    for result in result_list:
+        if result == best_hand:
+            winner_list[tie_index] += weight
+        tie_index += 1
+
+
+# Print results. game_odds and the player/opponent histograms are seen from
+# the first known hand (the player) against the others (the first of them
+# being the opponent): it wins, shares the pot (tie) or loses to another
+# hand. seats holds the win, tie and lose odds of every hand
+def parse_result(pocket_cards, winner_list, result_histograms, verbose=True):
     results = {
         'game_odds': {
             'win': float(),
@@ -291,61 +413,89 @@ def parse_result(pocket_cards, winner_list, result_histograms):
         'hand_odds': {
             'player': list(),
             'opponent': list()
-        }
+        },
+        'seats': list()
     }
-    float_iterations = float(sum(winner_list))
-    print('Winning Odds:')
+    # Print the odds along the way (unless verbose is False)
+    log = print if verbose else lambda *args: None
+    float_iterations = float(count_deals(winner_list))
+    num_players = len(pocket_cards)
+    known_seats = [index for index, hand_card in enumerate(pocket_cards) if hand_card != (None, None)]
+    player_index = known_seats[0] if known_seats else 0
+    opponent_index = 1 if player_index == 0 else 0
+    log('Winning Odds:')
     for index, hand_card in enumerate(pocket_cards):
-        winning_percentage = (float(winner_list[index + 1]) / float_iterations) * 100
+        wins, ties = float(winner_list[index + 1]), float(winner_list[num_players + 1 + index])
+        winning_percentage = (wins / float_iterations) * 100
+        tie_percentage = (ties / float_iterations) * 100
+        losing_percentage = ((float_iterations - wins - ties) / float_iterations) * 100
         if hand_card == (None, None):
-            results['game_odds']['lose'] = round(winning_percentage, 1)
-            print('Opponent (?, ?) : {} %'.format(round(winning_percentage, 1)))
+            log('Opponent (?, ?) : {} %'.format(round(winning_percentage, 1)))
         else:
-            results['game_odds']['win'] = round(winning_percentage, 1)
-            print('Player {} : {} %'.format(hand_card, round(winning_percentage, 1)))
-    results['game_odds']['tie'] = round((float(winner_list[0]) / float_iterations) * 100, 1)
-    print('Ties: {} %'.format(round((float(winner_list[0]) / float_iterations) * 100, 1)))
-    print()
-    for player_index, histogram in enumerate(result_histograms):
-        if player_index == 0:
-            print('Player histogram:')
-            user = 'player'
+            log('Player {} : {} %'.format(hand_card, round(winning_percentage, 1)))
+        results['seats'].append({
+            'hand': ['?', '?'] if hand_card == (None, None) else [str(card) for card in hand_card],
+            'win': round(winning_percentage, 1),
+            'tie': round(tie_percentage, 1),
+            'lose': round(losing_percentage, 1),
+            'hand_odds': list()
+        })
+    results['game_odds'] = dict((outcome, results['seats'][player_index][outcome])
+                                for outcome in ('win', 'lose', 'tie'))
+    log('Ties: {} %'.format(round((winner_list[0] / float_iterations) * 100, 1)))
+    log()
+    for seat_index, histogram in enumerate(result_histograms):
+        if seat_index == player_index:
+            log('Player histogram:')
         else:
-            print('Opponent histogram:')
-            user = 'opponent'
+            log('Opponent histogram:')
         for index, elem in enumerate(histogram):
             winning_percentage = (float(elem) / float_iterations) * 100
             # if winning_percentage == 0:
             #     continue
             hand_pair = [HAND_RANKINGS[index], round(winning_percentage, 1)]
-            results['hand_odds'][user].append(hand_pair)
-            print('{}: {} %'.format(HAND_RANKINGS[index], round(winning_percentage, 1)))
-        print()
+            results['seats'][seat_index]['hand_odds'].append(hand_pair)
+            log('{}: {} %'.format(HAND_RANKINGS[index], round(winning_percentage, 1)))
+        log()
+    results['hand_odds']['player'] = results['seats'][player_index]['hand_odds']
+    if len(result_histograms) > 1:
+        results['hand_odds']['opponent'] = results['seats'][opponent_index]['hand_odds']
     return results
 
 
 # Populate provided data structures with results from simulation
-def find_winner(generate_boards, deck, pocket_cards, board_length,
-                given_board, num_sims, winner_list, result_probabilities):
+# Note: evaluator is a module providing evaluate_hands and hand_category
+# (holdem_utils itself or holdem_evaluator)
+def find_winner(evaluator, generate_boards, deck, pocket_cards, board_length,
+                given_board, num_sims, winner_list, result_probabilities, seed=None, weight=1):
     # Run simulations
+    count_winners(evaluator, generate_boards(deck, num_sims, board_length, seed=seed),
+                  pocket_cards, given_board, winner_list, result_probabilities, weight)
+
+
+# Populate provided data structures with the results of the given boards,
+# each board counting weight times
+def count_winners(evaluator, remaining_boards, pocket_cards, given_board,
+                  winner_list, result_probabilities, weight=1):
+    # The runouts are copied into one board list after the given cards
+    # (evaluators never keep the board) and the results of every board are
+    # written to one result list
+    board_length = len(given_board) if given_board else 0
+    board = list(given_board) + [None] * (5 - board_length) if given_board else None
     result_list = [None] * len(pocket_cards)
-    for remaining_board in generate_boards(deck, num_sims, board_length):
+    for remaining_board in remaining_boards:
         # Generate a new board
         if given_board:
-            board = given_board[:]
-            board.extend(remaining_board)
+            board[board_length:] = remaining_board
         else:
             board = remaining_board
         # Find the best possible poker hand given the created board and the
         # hand cards and save them in the results data structures
-        suit_histogram, histogram, max_suit = (
-            preprocess_board(board))
-        for index, hand_card in enumerate(pocket_cards):
-            result_list[index] = detect_hand(hand_card, board, suit_histogram,
-                                             histogram, max_suit)
+        evaluator.evaluate_hands(pocket_cards, board, result_list)
         # Find the winner of the hand and tabulate results
-        winner_index = compare_hands(result_list)
-        winner_list[winner_index] += 1
+        count_winner(result_list, winner_list, weight)
         # Increment what hand each player made
-        for index, result in enumerate(result_list):
-            result_probabilities[index][result[0]] += 1
+        index = 0
+        for result in result_list:
+            result_probabilities[index][evaluator.hand_category(result)] += weight
+            index += 1
@@ -0,0 +1,186 @@
+import holdem_evaluator
+import holdem_utils
+
+import sys
+import tracemalloc
+
+from argparse import ArgumentParser
+from itertools import islice
+from time import perf_counter
+
+"""
+Memory benchmark
+----------------
+Measures the footprint of the card representation and the allocations of the
+simulation hot loop:
+
+- the size of a card, next to a plain card keeping its fields in a __dict__
+- the memory traced while building many decks
+- the time and the memory allocated per board while counting the winners of
+  a heads-up spot over a stream of random boards, for each evaluator taking
+  single boards (the numpy evaluator ranks whole batches instead), with the
+  buffers of holdem_utils.count_winners and with new lists for every board as
+  the loop used to build
+
+    python memory_benchmark.py --decks 10000 --boards 200000
+"""
+
+SPOT = (('Ah', 'Kd'), ('Qs', 'Qc'))
+BOARD = ('2c', '3s', 'Td')
+
+
+class DictCard:
+    """
+        A card keeping its fields in a __dict__, for comparison
+    """
+    def __init__(self, card_string):
+        """
+        :param card_string: The card, e.g. "As"
+        """
+        value, self.suit = card_string[0], card_string[1]
+        self.value = holdem_utils.SUIT_VALUES[value]
+        self.suit_index = holdem_utils.SUIT_INDEX[self.suit]
+
+
+def card_size(card) -> int:
+    """
+        Get the size of a card object, with its __dict__ if it has one
+    :param card: The card
+    :return: The size in bytes
+    """
+    size = sys.getsizeof(card)
+    if hasattr(card, '__dict__'):
+        size += sys.getsizeof(card.__dict__)
+    return size
+
+
+def traced(function, *args) -> tuple:
+    """
+        Run a function while tracing memory allocations
+    :param function: The function
+    :param args: Its arguments
+    :return: Its result, the memory still allocated after it and the peak memory, in bytes
+    """
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+
+def unbuffered_count_winners(evaluator, remaining_boards, pocket_cards, given_board,
+                            winner_list, result_histograms):
+    """
+        Count the winners over boards the way the hot loop used to, building
+        a new board, new results and (for detect_hand) new histograms for every
+        board, for comparison with holdem_utils.count_winners
+    """
+    for remaining_board in remaining_boards:
+        board = given_board[:]
+        board.extend(remaining_board)
+        if evaluator is holdem_utils:
+            suit_histogram, histogram, max_suit = holdem_utils.preprocess_board(board)
+            result_list = [holdem_utils.detect_hand(hand_card, board, suit_histogram, histogram, max_suit)
+                           for hand_card in pocket_cards]
+        else:
+            result_list = evaluator.evaluate_hands(pocket_cards, board)
+        holdem_utils.count_winner(result_list, winner_list)
+        for index, result in enumerate(result_list):
+            result_histograms[index][evaluator.hand_category(result)] += 1
+
+
+def traced_boards(count, evaluator, boards: list, *args) -> float:
+    """
+        Trace the memory a hot loop allocates per board: the peak traced while
+        evaluating each board, above the memory held before it. Temporaries
+        freed within the board are counted, as they raise the peak
+    :param count: The hot loop (holdem_utils.count_winners or unbuffered_count_winners)
+    :param evaluator: The evaluator module
+    :param boards: The runouts
+    :param args: The other arguments of the hot loop
+    :return: The mean number of bytes allocated per board
+    """
+    allocated = [0]
+
+    def traced_runouts():
+        for remaining_board in boards:
+            held = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            yield remaining_board
+            allocated[0] += tracemalloc.get_traced_memory()[1] - held
+
+    tracemalloc.start()
+    try:
+        count(evaluator, traced_runouts(), *args)
+    finally:
+        tracemalloc.stop()
+    return allocated[0] / len(boards)
+
+
+def build_decks(num_decks: int) -> list:
+    """
+        Build the deck of the benchmark spot many times
+    :param num_decks: The number of decks
+    :return: The decks
+    """
+    pocket_cards = tuple(tuple(holdem_utils.Card(card) for card in hand) for hand in SPOT)
+    board = [holdem_utils.Card(card) for card in BOARD]
+    return [holdem_utils.generate_deck(pocket_cards, board) for _ in range(num_decks)]
+
+
+def run_boards(evaluator, encode, num_boards: int, count=holdem_utils.count_winners, trace: bool = False):
+    """
+        Count the winners of the benchmark spot over random boards
+    :param evaluator: The evaluator module (see holdem_calculator.EVALUATORS)
+    :param encode: The function converting the cards for the evaluator
+    :param num_boards: The number of boards
+    :param count: The hot loop (holdem_utils.count_winners or unbuffered_count_winners)
+    :param trace: Whether to trace the allocations of the loop instead of timing it
+    :return: The time taken in seconds, or the bytes allocated per board (see traced_boards)
+    """
+    pocket_cards = tuple(tuple(holdem_utils.Card(card) for card in hand) for hand in SPOT)
+    board = [holdem_utils.Card(card) for card in BOARD]
+    deck = holdem_utils.generate_deck(pocket_cards, board)
+    # Draw the boards beforehand so that only the counting is measured
+    boards = [[encode(card) for card in remaining_board] for remaining_board in
+              islice(holdem_utils.generate_random_boards(deck, num_boards, len(board), seed=0), num_boards)]
+    pocket_cards = tuple((encode(first_card), encode(second_card)) for first_card, second_card in pocket_cards)
+    board = [encode(card) for card in board]
+    winner_list = holdem_utils.new_winner_list(len(pocket_cards))
+    result_histograms = [[0] * len(holdem_utils.HAND_RANKINGS) for _ in pocket_cards]
+    if trace:
+        return traced_boards(count, evaluator, boards, pocket_cards, board, winner_list, result_histograms)
+    start = perf_counter()
+    count(evaluator, boards, pocket_cards, board, winner_list, result_histograms)
+    return perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser(description='Measure the memory footprint of the cards and the hot loop')
+    parser.add_argument('--decks', type=int, default=10000, help='Number of decks built')
+    parser.add_argument('--boards', type=int, default=200000, help='Number of boards counted per evaluator')
+    args = parser.parse_args()
+
+    print('Card: {} bytes ({} bytes with a __dict__)'.format(card_size(holdem_utils.Card('As')),
+                                                            card_size(DictCard('As'))))
+    decks, current, peak = traced(build_decks, args.decks)
+    print('{} decks: {:.1f} kB allocated, {:.1f} kB peak'.format(len(decks), current / 1024, peak / 1024))
+    del decks
+
+    num_traced = min(args.boards, 10000)
+    for name, evaluator, encode in (('detect_hand', holdem_utils, lambda card: card),
+                                    ('lookup', holdem_evaluator, holdem_evaluator.encode_card)):
+        for loop, count in (('buffers', holdem_utils.count_winners),
+                            ('no buffers', unbuffered_count_winners)):
+            run_boards(evaluator, encode, min(args.boards, 1000), count)
+            elapsed = run_boards(evaluator, encode, args.boards, count)
+            # Tracing slows the loop down, so the allocations are measured on their own run
+            allocated = run_boards(evaluator, encode, num_traced, count, trace=True)
+            print('{} ({}): {:.2f} us and {:.0f} bytes allocated per board'.format(
+                name, loop, elapsed / args.boards * 1e6, allocated))
+
+
+if __name__ == '__main__':
+    main()